@@ -1,42 +1,65 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import joblib
-import numpy as np
-import pandas as pd
-import requests
-import uvicorn
+import time
+# Measured from the first import so the logged start-up cost covers every module the app pulls in
+_import_started = time.perf_counter()
+
 import os
-import random
-from fastapi import FastAPI, HTTPException
+import asyncio
+import threading
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import joblib
 import numpy as np
 import pandas as pd
-import uvicorn
-import yfinance as yf
-import requests
-import pickle
+import httpx
 import json
 import logging
 from datetime import datetime, timedelta
-from mlxtend.frequent_patterns import apriori
-from mlxtend.frequent_patterns import association_rules
-from typing import Dict, Any
+from typing import Dict, Any, Literal, Optional
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import os
+from store import BarStore, format_timestamp, parse_values, to_frame
+from fundamentals import FundamentalsCache
+from upstream import http_get_json, run_blocking, close as close_upstream
+from scheduler import UpstreamScheduler, UpstreamRateLimited
+from export import MEDIA_TYPES, SERIALISERS, bar_range, resolve_columns, to_export_frame
+from indicators import IndicatorEngine
+from forecast_cache import CachedRollout, ForecastCache, new_rollout
+from forecasting import rollout
+from portfolio import analyse as analyse_portfolio, sanitize
+from association import mine_rules, rolling_rules
+from correlation import CorrelationTracker, align_closes
+from ingest import load_symbol, read_manifest
+from finetune import FineTuneScheduler
+from train import read_training_meta
+from rules_store import RulesStore, run_key
+from telemetry import TelemetryMiddleware, TimedRoute, configure_logging, debug_sampled, in_flight, record_stage, render_metrics, stage
+from prefetch import DemandTracker, Prefetcher
+from streaming import StreamHub
 load_dotenv(dotenv_path='.env.local') 
 
-app = FastAPI(title="Stock Price Prediction API")
-import logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Output to console
-        logging.FileHandler('stock_analysis.log')  # Output to a log file
-    ]
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Long-running servers pay the model load before taking traffic; serverless
+    # entry points (api/index.py) skip the lifespan and load on first use
+    if os.getenv("WARM_UP_ON_STARTUP", "1") == "1":
+        await run_in_threadpool(warm_up)
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+    yield
+    # Release pooled upstream connections on shutdown
+    await stream_hub.close()
+    await prefetcher.stop()
+    finetune_scheduler.shutdown(wait=False)
+    await twelve_data_scheduler.close()
+    await close_upstream()
+
+app = FastAPI(title="Stock Price Prediction API", lifespan=lifespan)
+# Routes also time request parsing and response serialisation (see telemetry.py)
+app.router.route_class = TimedRoute
+# Records are written to the console and the log file by a background thread
+configure_logging('stock_analysis.log')
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
@@ -44,13 +67,8 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
-# Load the trained LSTM model and scaler from pickle files
-try:
-    model = joblib.load("stock_price_prediction2.pkl")
-    scaler = joblib.load("scaler2.pkl")
-except Exception as e:
-    raise HTTPException(status_code=500,detail=f"Error loading model or scaler: {e}")
-
+# Outermost, so Server-Timing and the request histograms cover the whole request
+app.add_middleware(TelemetryMiddleware)
 # Twelve Data API details
 TWELVE_DATA_API_KEY = os.getenv("TWELVE_DATA_API_KEY")
 TWELVE_DATA_BASE_URL = "https://api.twelvedata.com"
@@ -62,9 +80,37 @@ class StockAssociationRequest(BaseModel):
     min_support: float = 0.2  # Default min support
     min_lift: float = 1.0  # Default min lift
 
+class AssociationRulesQuery(StockAssociationRequest):
+    min_confidence: float = 0.0
+    antecedent: Optional[str] = None  # Only rules whose antecedents include this ticker
+    consequent: Optional[str] = None  # Only rules whose consequents include this ticker
+    sort_by: Literal["lift", "confidence", "support"] = "lift"
+    top_k: Optional[int] = 20  # None returns every matching rule
+
+class RollingAssociationRequest(StockAssociationRequest):
+    window: int = 60  # Trading days per window
+    step: int = 1  # Days the window slides between results
+    max_len: Optional[int] = 2  # Largest itemset size; None for unlimited
+
+class CorrelationRequest(BaseModel):
+    symbols: list[str]
+    method: Literal["correlation", "covariance"] = "correlation"
+    min_periods: int = 20  # Fewer common trading days than this gives null
+
+class PeersRequest(BaseModel):
+    symbol: str
+    k: int = 10
+    min_periods: int = 20
+    universe: Optional[list[str]] = None  # Symbols to add to the tracked universe first
+
 class StockDataRequest(BaseModel):
     symbol: str  # e.g., "AAPL"
     interval: str = "1h"  # Default: "1h"
+    format: Literal["json", "csv", "ndjson", "arrow"] = "json"  # "json" wraps the CSV in a JSON object; others stream
+    start_date: Optional[str] = None  # Inclusive, e.g. "2024-01-02" or "2024-01-02 15:30:00"
+    end_date: Optional[str] = None  # Inclusive
+    columns: Optional[list[str]] = None  # Subset of Open, High, Low, Close, Volume; default all
+    indicators: Optional[list[str]] = None  # e.g. ["sma_20", "ema_12", "rsi_14", "macd", "bbands_20_2"]
 
 class ForecastRequest(BaseModel):
     symbol: str  # Stock symbol to forecast
@@ -76,181 +122,732 @@ class StockAnalysisRequest(BaseModel):
     start_date: str = "2023-01-01"
     end_date: str = "2024-01-01"
 
-# Load the trained LSTM model and scaler from pickle files
-try:
-    model = joblib.load("stock_price_prediction.pkl")
-    scaler = joblib.load("scaler.pkl")
-except Exception as e:
-    raise Exception(f"Error loading model or scaler: {e}")
+class PortfolioAnalysisRequest(BaseModel):
+    symbols: list[str]
+    start_date: str = "2023-01-01"
+    end_date: str = "2024-01-01"
+    windows: list[int] = [21, 63]  # Rolling windows in trading days
+    risk_free_rate: float = 0.02  # Annual
+    # Optional inline closes matrix (one row per date, one column per symbol) instead of fetching from yfinance
+    dates: Optional[list[str]] = None
+    closes: Optional[list[list[Optional[float]]]] = None
 
-def fetch_twelve_data(symbol: str, interval: str) -> pd.DataFrame:
-    """Fetch stock data from Twelve Data and return as DataFrame."""
-    endpoint = f"{TWELVE_DATA_BASE_URL}/time_series"
-    
-    params = {
-        "symbol": symbol,
-        "interval": interval,
-        "apikey": TWELVE_DATA_API_KEY,
-        "outputsize": "5000"  # Get maximum available data points
-    }
-    
+class FineTuneRequest(BaseModel):
+    symbol: Optional[str] = None  # Daily bars to fine-tune on; defaults to the ticker the model was trained on
+    epochs: int = 5
+    learning_rate: float = 1e-4
+
+# The trained LSTM model and scaler load on first use (see load_models) so that
+# routes which never forecast, like /fetch_data, do not pay for them
+_models = None
+_models_lock = threading.Lock()
+# What the loaded pair was built from (see served_version) and when that was last checked
+_models_version = None
+_models_checked = 0.0
+# finetune.py updates these files in place; swap_models then serves the new model
+MODEL_PATH = os.getenv("MODEL_PATH", "stock_price_prediction.pkl")
+SCALER_PATH = os.getenv("SCALER_PATH", "scaler.pkl")
+# Seconds between checks for a model swapped by another worker or replaced on disk
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "1"))
+models_swapped_at = None
+
+# Address of a shared inference_server.py process; unset loads the model in this worker.
+# Either way, forecast steps from concurrent requests are micro-batched into one predict call.
+INFERENCE_SERVER = os.getenv("INFERENCE_SERVER")
+INFERENCE_BATCHING = {
+    "max_batch": int(os.getenv("INFERENCE_MAX_BATCH", "256")),
+    "max_wait": float(os.getenv("INFERENCE_MAX_WAIT_MS", "2")) / 1000,
+}
+
+def build_models(previous=None):
+    """Load a (model, scaler) pair from MODEL_PATH and SCALER_PATH, reusing the inference server client of `previous`."""
+    import joblib
+    from inference import load_backend
+    from inference_server import MicroBatcher, RemoteBackend
+    if INFERENCE_SERVER:
+        # One shared model process serves every API worker and loads new weights itself
+        model = previous[0] if previous is not None else RemoteBackend(INFERENCE_SERVER)
+    else:
+        model = MicroBatcher(load_backend(MODEL_PATH), **INFERENCE_BATCHING)
+    return model, joblib.load(SCALER_PATH)
+
+def served_version(model=None):
+    """
+    Identifies the weights being served: the inference server's (epoch,
+    generation), which a reload from any worker or a server restart changes,
+    or else the modification times of the model files.
+    """
+    if INFERENCE_SERVER:
+        return model.version()
+    return tuple(os.stat(path).st_mtime_ns for path in (MODEL_PATH, SCALER_PATH))
+
+def _replace_models():
+    """Load the pair and serve it from now on; called with _models_lock held."""
+    global _models, _models_version, models_swapped_at
+    old_models = _models
+    # Files are stamped before they are read, so files replaced during the load are noticed next time
+    stamp = None if INFERENCE_SERVER else served_version()
+    new_models = build_models(old_models)
+    _models, _models_version = new_models, stamp or served_version(new_models[0])
+    # Rollouts of the old weights; seeded_forecast checks the version before caching a new one
+    forecast_cache.clear()
+    if old_models is not None:
+        models_swapped_at = time.time()
+        if old_models[0] is not new_models[0]:
+            old_models[0].close()
+        logging.info(f"Serving {MODEL_PATH} (trained up to {read_training_meta(MODEL_PATH).get('cutoff')})")
+
+def load_models():
+    """
+    Return the (model, scaler) pair, loading it from disk on the first call.
+
+    At most every MODEL_CHECK_INTERVAL seconds it also checks whether the
+    served weights changed (a swap in another worker, a restarted inference
+    server, files replaced by finetune.py or train.py) and reloads the pair if so.
+    """
+    global _models_checked
+    if _models is not None and time.monotonic() - _models_checked < MODEL_CHECK_INTERVAL:
+        return _models
+    with _models_lock:
+        if _models is None:
+            started = time.perf_counter()
+            try:
+                _replace_models()
+            except Exception as e:
+                raise Exception(f"Error loading model or scaler: {e}")
+            # Shows up in Server-Timing of the request that paid for the load
+            record_stage("model_load", time.perf_counter() - started)
+        elif time.monotonic() - _models_checked >= MODEL_CHECK_INTERVAL and served_version(_models[0]) != _models_version:
+            _replace_models()
+        _models_checked = time.monotonic()
+    return _models
+
+async def swap_models():
+    """
+    Serve the model files as they are on disk now, in every worker.
+
+    With an inference server, the server loads them once and each worker
+    drops its cached rollouts when it next sees the server's new version.
+    Otherwise this worker reloads now and the others notice the replaced
+    files on their next check (see load_models). Requests already holding
+    the old pair finish with it, so no forecast mixes the two.
+    """
+    def swap():
+        global _models_checked
+        if INFERENCE_SERVER:
+            model, _ = load_models()
+            model.reload()
+        with _models_lock:
+            _replace_models()
+            _models_checked = time.monotonic()
+
+    await run_in_threadpool(swap)
+
+def warm_up():
+    """
+    Load the models and import the libraries that routes otherwise import lazily.
+
+    Returns:
+        Dict of seconds spent per step
+    """
+    timings = {}
+    started = time.perf_counter()
+    load_models()
+    timings["models"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    import yfinance  # noqa: F401
+    timings["imports"] = round(time.perf_counter() - started, 3)
+
+    logging.info(f"Warm-up finished: {timings}")
+    return timings
+
+def yf_download(*args, **kwargs):
+    """`yf.download`, importing yfinance on first use."""
+    import yfinance as yf
+    return yf.download(*args, **kwargs)
+
+# yfinance fundamentals, fetched once per symbol and reused until FUNDAMENTALS_TTL expires
+fundamentals_cache = FundamentalsCache(
+    ttl=float(os.getenv("FUNDAMENTALS_TTL", "900")),
+    max_symbols=int(os.getenv("FUNDAMENTALS_CACHE_SIZE", "256"))
+)
+
+class TwelveDataError(Exception):
+    """Twelve Data answered without a `values` series; `data` holds the response."""
+
+    def __init__(self, data):
+        super().__init__(data.get("message", "Unknown error"))
+        self.data = data
+
+# Twelve Data's maximum outputsize; also the number of bars kept per stored series
+TWELVE_DATA_MAX_OUTPUTSIZE = 5000
+bar_store = BarStore(os.getenv("BAR_STORE_DIR", "bar_store"), max_bars=TWELVE_DATA_MAX_OUTPUTSIZE)
+# Stored series refreshed less than this many seconds ago are served without an upstream call
+BAR_STORE_TTL = float(os.getenv("BAR_STORE_TTL", "60"))
+
+def series_fresh(symbol: str, interval: str) -> bool:
+    """True if the stored series needs no refresh (see BarStore.is_fresh)."""
+    return bar_store.is_fresh(symbol, interval, BAR_STORE_TTL)
+
+# Seeded forecast rollouts keyed by (symbol, last bar timestamp, seed)
+forecast_cache = ForecastCache(max_entries=int(os.getenv("FORECAST_CACHE_SIZE", "1024")))
+
+# Decayed request counts per target (bars, seeded forecast, analysis); the prefetcher warms the hottest
+demand = DemandTracker(half_life=float(os.getenv("PREFETCH_HALF_LIFE", "3600")))
+
+# Running indicator state per (symbol, interval, indicator); only new bars are computed
+indicator_engine = IndicatorEngine(max_series=int(os.getenv("INDICATOR_CACHE_SIZE", "1024")))
+
+# All Twelve Data calls share the plan's per-minute credits (8 on the free Basic plan)
+# Uvicorn workers each run their own scheduler, so the account's quota is split between them
+API_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+twelve_data_scheduler = UpstreamScheduler(
+    credits_per_minute=int(os.getenv("TWELVE_DATA_CREDITS_PER_MINUTE", "8")) / API_WORKERS,
+    default_timeout=float(os.getenv("TWELVE_DATA_DEADLINE", "30"))
+)
+
+async def request_time_series(params, deadline=None):
+    """
+    Call the Twelve Data time_series endpoint and return the decoded JSON.
+
+    Calls go through `twelve_data_scheduler`: identical concurrent requests
+    share one upstream call, and calls wait for credits (earliest `deadline`
+    first) rather than failing when the per-minute quota is used up. Raises
+    UpstreamRateLimited if upstream keeps refusing the call, e.g. once the
+    daily quota is spent.
+    """
+    async def call():
+        data = await http_get_json(f"{TWELVE_DATA_BASE_URL}/time_series", {**params, "apikey": TWELVE_DATA_API_KEY})
+        if data.get("code") == 429:
+            raise UpstreamRateLimited(data.get("message"))
+        return data
+
+    key = tuple(sorted(params.items()))
+    # Batch requests are billed one credit per symbol
+    cost = len(str(params["symbol"]).split(","))
+    # Includes any wait for credits, so a throttled request shows up as upstream time
+    with stage("upstream"):
+        data = await twelve_data_scheduler.submit(key, call, cost=cost, deadline=deadline)
+
+    # Log response for debugging; dumping 5000 bars is costly, so only a sample when enabled
+    debug_sampled(lambda: json.dumps(data, indent=2))
+
+    return data
+
+def parse_series(series, incremental):
+    """
+    Parse one Twelve Data series into bars.
+
+    An incremental request (with `start_date`) that finds no newer bars is
+    answered with an error by Twelve Data; that case yields no bars instead.
+    """
+    if "values" in series:
+        return parse_values(series["values"])
+    if incremental and "no data is available" in str(series.get("message", "")).lower():
+        return parse_values([])
+    raise TwelveDataError(series)
+
+# One refresh at a time per (symbol, interval); later requests then find the series fresh
+refresh_locks: Dict[tuple, asyncio.Lock] = {}
+
+async def refresh_bars(symbol: str, interval: str, deadline: Optional[float] = None):
+    """
+    Return stored bars for (symbol, interval), fetching only newer bars from Twelve Data.
+
+    A series that is missing, or was only partially fetched, is downloaded in
+    full; otherwise upstream is asked for bars from the last stored timestamp on.
+    `deadline` orders the upstream call among queued ones (see request_time_series).
+    """
+    async with refresh_locks.setdefault((symbol.upper(), interval), asyncio.Lock()):
+        stored = bar_store.load(symbol, interval)
+        incremental = stored is not None and len(stored) > 0 and bar_store.meta(symbol, interval).get("backfilled", False)
+        if incremental and series_fresh(symbol, interval):
+            return stored
+
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "outputsize": TWELVE_DATA_MAX_OUTPUTSIZE  # Get maximum available data points
+        }
+        if incremental:
+            params["start_date"] = format_timestamp(stored["datetime"][-1])
+
+        data = await request_time_series(params, deadline)
+        with stage("parse"):
+            new_bars = parse_series(data, incremental)
+        with stage("store"):
+            return bar_store.update(symbol, interval, new_bars, backfilled=not incremental)
+
+async def fetch_twelve_bars(symbol: str, interval: str):
+    """Fetch bars from the local bar store, refreshed from Twelve Data."""
     try:
-        response = requests.get(endpoint, params=params)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        data = response.json()
-        
-        # Log response for debugging
-        logging.debug(json.dumps(data, indent=2))
-        
-        if "values" not in data:
-            raise HTTPException(status_code=400, detail=f"Invalid API response: {data}")
-        
-        # Convert API response to DataFrame
-        df = pd.DataFrame(data["values"])
-        
-        # Convert string values to appropriate types
-        df["datetime"] = pd.to_datetime(df["datetime"])
-        numeric_columns = ["open", "high", "low", "close", "volume"]
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col])
-        
-        # Rename columns to match existing code
-        df = df.rename(columns={
-            "datetime": "Date",
-            "open": "Open",
-            "high": "High",
-            "low": "Low",
-            "close": "Close",
-
-            "volume": "Volume"
-        })
-        
-        # Set index and sort
-        df.set_index("Date", inplace=True)
-        df.sort_index(inplace=True)
-        
-        return df
-        
-    except requests.exceptions.RequestException as e:
+        return await refresh_bars(symbol, interval)
+    except TwelveDataError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid API response: {e.data}")
+    except UpstreamRateLimited as e:
+        raise HTTPException(status_code=429, detail=f"Twelve Data credits used up: {e}")
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Error fetching data from Twelve Data: {str(e)}")
 
-@app.post("/stock_association")
-def stock_association(request: StockAssociationRequest):
-    try:
+async def fetch_twelve_data(symbol: str, interval: str) -> pd.DataFrame:
+    """Fetch stock data from the local bar store, refreshed from Twelve Data, as a DataFrame."""
+    return to_frame(await fetch_twelve_bars(symbol, interval))
+
+# Mined rule sets keyed by (tickers, date range, thresholds); stricter requests filter a stored run
+rules_store = RulesStore(
+    os.getenv("RULES_STORE_DIR", "rules_store"),
+    ttl=float(os.getenv("RULES_STORE_TTL", "3600"))
+)
+# One mining run at a time per (tickers, date range); concurrent requests then reuse it
+association_locks: Dict[str, asyncio.Lock] = {}
+
+async def stored_rules(request: StockAssociationRequest):
+    """
+    Rules for the request's tickers and dates, mined with thresholds no stricter than requested.
+
+    Returns:
+        Tuple of (StoredRules, cached): cached is False if the rules were just mined
+    """
+    lookup = (request.tickers, request.start_date, request.end_date, request.min_support, request.min_lift)
+    async with association_locks.setdefault(run_key(request.tickers, request.start_date, request.end_date), asyncio.Lock()):
+        stored = await run_in_threadpool(rules_store.find, *lookup)
+        if stored is not None:
+            return stored, True
+
         # Fetch stock data using yfinance (keeping this as is since it handles multiple symbols well)
-        df = yf.download(request.tickers, start=request.start_date, end=request.end_date)
+        with stage("upstream"):
+            df = await run_blocking(yf_download, request.tickers, start=request.start_date, end=request.end_date)
         df = df["Close"]  # Fix MultiIndex issue
 
         # Convert to binary transactions
         df_returns = df.pct_change().dropna()
         df_binary = df_returns > 0  # Boolean values (True = price increase, False = decrease)
 
-        # Apply Apriori Algorithm
-        frequent_itemsets = apriori(df_binary, min_support=request.min_support, use_colnames=True)
-        rules = association_rules(frequent_itemsets, metric="lift", min_threshold=request.min_lift)
-
-        # Save rules as a pickle file
-        pickle_filename = "association_rules.pkl"
-        with open(pickle_filename, "wb") as f:
-            pickle.dump(rules, f)
-
-        # Format results for JSON response
-        rules_list = []
-        for _, row in rules.iterrows():
-            rules_list.append({
-                "antecedents": list(row["antecedents"]),
-                "consequents": list(row["consequents"]),
-                "support": round(row["support"], 4),
-                "confidence": round(row["confidence"], 4),
-                "lift": round(row["lift"], 4)
-            })
+        # Apply Apriori over packed bitsets (same rules as mlxtend's apriori + association_rules)
+        with stage("analysis"):
+            rules = await run_in_threadpool(mine_rules, df_binary, request.min_support, request.min_lift)
+
+        stored = await run_in_threadpool(rules_store.save, *lookup, rules, len(df_binary))
+        return stored, False
+
+@app.post("/stock_association")
+async def stock_association(request: StockAssociationRequest):
+    try:
+        stored, cached = await stored_rules(request)
+        rules = stored.select(min_support=request.min_support, min_lift=request.min_lift)
 
         return {
             "message": "Stock association rules generated successfully!",
-            "rules": rules_list,
-            "pickle_file": pickle_filename
+            "rules": stored.records(rules),
+            "cached": cached
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing stock association: {e}")
 
+@app.post("/stock_association/rules")
+async def query_association_rules(request: AssociationRulesQuery):
+    """Filter and rank stored rules without mining; 404 if no stored run covers the request."""
+    if request.top_k is not None and request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be at least 1.")
+
+    stored = await run_in_threadpool(
+        rules_store.find, request.tickers, request.start_date, request.end_date, request.min_support, request.min_lift
+    )
+    if stored is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No stored rules cover these tickers, dates and thresholds; mine them with /stock_association first."
+        )
+
+    matched = stored.select(
+        min_support=request.min_support,
+        min_lift=request.min_lift,
+        min_confidence=request.min_confidence,
+        antecedent=request.antecedent,
+        consequent=request.consequent,
+    )
+    return {
+        "rules": stored.records(stored.top(matched, request.sort_by, request.top_k)),
+        "matched": len(matched),
+        "mined_with": {
+            "min_support": stored.meta["min_support"],
+            "min_lift": stored.meta["min_lift"],
+            "mined_at": datetime.fromtimestamp(stored.meta["created_at"]).isoformat(timespec="seconds"),
+        }
+    }
+
+def format_rules(rules):
+    """JSON-ready rows for an association rules DataFrame."""
+    return [
+        {
+            "antecedents": list(row["antecedents"]),
+            "consequents": list(row["consequents"]),
+            "support": round(row["support"], 4),
+            "confidence": round(row["confidence"], 4),
+            "lift": round(row["lift"], 4)
+        }
+        for _, row in rules.iterrows()
+    ]
+
+@app.post("/stock_association/rolling")
+async def rolling_stock_association(request: RollingAssociationRequest):
+    if request.window < 2 or request.step < 1:
+        raise HTTPException(status_code=400, detail="window must be at least 2 and step at least 1.")
+
+    try:
+        with stage("upstream"):
+            df = await run_blocking(yf_download, request.tickers, start=request.start_date, end=request.end_date)
+        df_binary = df["Close"].pct_change().dropna() > 0
+
+        def mine_windows():
+            return [
+                {"start": str(first.date()), "end": str(last.date()), "rules": format_rules(rules)}
+                for first, last, rules in rolling_rules(
+                    df_binary, request.window, request.min_support, request.min_lift,
+                    step=request.step, max_len=request.max_len
+                )
+            ]
+
+        with stage("analysis"):
+            windows = await run_in_threadpool(mine_windows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing rolling stock association: {e}")
+
+    return {
+        "message": "Rolling stock association rules generated successfully!",
+        "window": request.window,
+        "step": request.step,
+        "windows": windows
+    }
+
 @app.post("/fetch_data")
-def fetch_data(request: StockDataRequest):
-    df = fetch_twelve_data(request.symbol, request.interval)
-    return {"message": "Stock data fetched successfully!", "csv_data": df.to_csv()}
+async def fetch_data(request: StockDataRequest):
+    demand.hit(("bars", request.symbol.upper(), request.interval))
+    bars = await fetch_twelve_bars(request.symbol, request.interval)
+
+    try:
+        columns = resolve_columns(request.columns)
+        # Indicators run over the whole stored series so the requested range starts warmed up
+        extra = {}
+        if request.indicators:
+            with stage("indicators"):
+                extra = await run_in_threadpool(
+                    indicator_engine.compute, request.symbol, request.interval, bars, request.indicators
+                )
+        selected = bar_range(bars, request.start_date, request.end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    bars = bars[selected]
+    extra = {name: values[selected] for name, values in extra.items()}
+
+    if request.format == "json":
+        with stage("export"):
+            csv_data = await run_in_threadpool(lambda: to_export_frame(bars, columns, extra).to_csv())
+        return {"message": "Stock data fetched successfully!", "csv_data": csv_data}
+
+    if request.format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="Arrow export requires pyarrow to be installed.")
+
+    # Starlette iterates sync generators in the threadpool, one chunk at a time
+    filename = f"{request.symbol}_{request.interval}.{request.format}".replace("/", "_")
+    return StreamingResponse(
+        SERIALISERS[request.format](bars, columns, extra),
+        media_type=MEDIA_TYPES[request.format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # Define the sequence length (must match the training sequence length)
 sequence_length = 60
 
-def fetch_stock_data(stock_symbol):
-    """Fetch the last 60 days of closing prices from Twelve Data API."""
-    url = f"{TWELVE_DATA_BASE_URL}/time_series"
-    params = {
-        "symbol": stock_symbol,
-        "interval": "1day",
-        "apikey": TWELVE_DATA_API_KEY,
-        "outputsize": sequence_length
-    }
-    
-    response = requests.get(url, params=params)
-    data = response.json()
-    
-    if "values" not in data:
-        raise HTTPException(status_code=500, detail=f"Error fetching stock data: {data.get('message', 'Unknown error')}")
-    
-    df = pd.DataFrame(data["values"])
-    df["datetime"] = pd.to_datetime(df["datetime"])
-    df.set_index("datetime", inplace=True)
-    df = df.sort_index()
-    df["close"] = df["close"].astype(float)
+def scale_window(bars, scaler):
+    """
+    Scale the last `sequence_length` closes of `bars` into a model input window.
+
+    `scaler` comes from the caller's `load_models()`, run off the event loop,
+    since that may wait on the inference server or load a new model.
+    """
+    closes = np.asarray(bars["close"][-sequence_length:], dtype=float).reshape(-1, 1)
+    with stage("preprocess"):
+        return scaler.transform(closes)
+
+async def fetch_stock_bars(stock_symbol):
+    """Fetch daily bars from the bar store, refreshed from Twelve Data."""
+    try:
+        return await refresh_bars(stock_symbol, "1day")
+    except TwelveDataError as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching stock data: {e}")
+    except UpstreamRateLimited as e:
+        raise HTTPException(status_code=429, detail=f"Twelve Data credits used up: {e}")
+
+async def fetch_stock_data(stock_symbol, scaler):
+    """Fetch the last 60 days of closing prices from the bar store, refreshed from Twelve Data."""
+    bars = await fetch_stock_bars(stock_symbol)
 
     # Normalize the data using the existing scaler
-    data_values = df["close"].values.reshape(-1, 1)
-    scaled_data = scaler.transform(data_values)
-    
-    return scaled_data
+    return scale_window(bars, scaler)
+
+# Twelve Data accepts up to 120 comma-separated symbols per time_series call
+TWELVE_DATA_MAX_BATCH = 120
+
+async def fetch_stock_data_batch(stock_symbols, scaler):
+    """
+    Fetch the last 60 daily closes for many symbols using batched Twelve Data calls.
+
+    Symbols that are fresh (see series_fresh) are served from the bar store.
+    Stored symbols are grouped by their last bar and asked only for newer bars;
+    unknown symbols fetch just the 60-bar window.
+
+    Returns:
+        Tuple of (windows, errors): windows maps each symbol to its scaled
+        (sequence_length, 1) window, errors maps failed symbols to a message.
+    """
+    windows = {}
+    errors = {}
+    groups = {}
+
+    for symbol in stock_symbols:
+        stored = bar_store.load(symbol, "1day")
+        if stored is None or len(stored) == 0:
+            groups.setdefault(("outputsize", sequence_length), []).append(symbol)
+        elif len(stored) >= sequence_length and series_fresh(symbol, "1day"):
+            windows[symbol] = scale_window(stored, scaler)
+        else:
+            groups.setdefault(("start_date", format_timestamp(stored["datetime"][-1])), []).append(symbol)
+
+    async def fetch_chunk(chunk, incremental, params):
+        try:
+            data = await request_time_series(params)
+            if len(chunk) > 1 and data.get("status") == "error":
+                # The whole batch was rejected (bad key, plan limits); its message applies to every symbol
+                raise TwelveDataError(data)
+        except (httpx.HTTPError, TwelveDataError, UpstreamRateLimited) as e:
+            for symbol in chunk:
+                errors[symbol] = f"Error fetching stock data: {e}"
+            return
+
+        # A single-symbol request returns the series itself instead of a dict keyed by symbol
+        if len(chunk) == 1:
+            data = {chunk[0]: data}
+
+        for symbol in chunk:
+            try:
+                with stage("parse"):
+                    bars = bar_store.update(symbol, "1day", parse_series(data.get(symbol) or {}, incremental))
+            except TwelveDataError as e:
+                errors[symbol] = f"Error fetching stock data: {e}"
+                continue
+
+            if len(bars) < sequence_length:
+                errors[symbol] = f"Not enough history: need {sequence_length} daily closes, got {len(bars)}"
+                continue
+            windows[symbol] = scale_window(bars, scaler)
+
+    # All chunks are requested concurrently over the pooled client
+    requests_to_send = []
+    for (param, value), symbols in groups.items():
+        incremental = param == "start_date"
+        for start in range(0, len(symbols), TWELVE_DATA_MAX_BATCH):
+            chunk = symbols[start:start + TWELVE_DATA_MAX_BATCH]
+            params = {
+                "symbol": ",".join(chunk),
+                "interval": "1day",
+                "outputsize": TWELVE_DATA_MAX_OUTPUTSIZE if incremental else sequence_length,
+            }
+            if incremental:
+                params["start_date"] = value
+            requests_to_send.append(fetch_chunk(chunk, incremental, params))
+
+    await asyncio.gather(*requests_to_send)
+
+    return windows, errors
 
 def multi_step_forecast(model, last_sequence, forecast_days, scaler):
-    """Predict future stock prices with added randomness to prevent constant trends."""
-    predictions_scaled = []
-    current_sequence = last_sequence.copy()
+    """
+    Predict future stock prices with added randomness to prevent constant trends.
 
-    for _ in range(forecast_days):
-        current_input = np.reshape(current_sequence, (1, sequence_length, 1))
-        pred_scaled = model.predict(current_input)[0, 0]
-        
-        # Add slight randomness to prevent a strict downtrend
-        random_factor = random.uniform(0.98, 1.02)  # Adjust within a 2% range
-        pred_scaled *= random_factor
-        
-        predictions_scaled.append(pred_scaled)
-        current_sequence = np.append(current_sequence, [[pred_scaled]], axis=0)
-        current_sequence = current_sequence[1:]
-    
-    predictions = scaler.inverse_transform(np.array(predictions_scaled).reshape(-1, 1))
-    return predictions.flatten()
+    `model` is an inference backend (see inference.py). `last_sequence` is
+    either one (sequence_length, 1) window or a batch of windows shaped
+    (N, sequence_length, 1).
+    """
+    batched = np.ndim(last_sequence) == 3
+    predictions_scaled = rollout(model, last_sequence, forecast_days)
+    batch_size = predictions_scaled.shape[0]
+    predictions = scaler.inverse_transform(predictions_scaled.reshape(-1, 1)).reshape(batch_size, forecast_days)
+    return predictions if batched else predictions[0]
+
+def extend_rollout(model, entry, forecast_days):
+    """Continue a cached seeded rollout until it covers `forecast_days` steps."""
+    rng = entry.generator()
+    steps = forecast_days - entry.horizon
+    window = np.concatenate([entry.window, entry.predictions])[-sequence_length:]
+    predictions = rollout(model, window, steps, rngs=[rng])[0]
+    return CachedRollout(
+        window=entry.window,
+        predictions=np.concatenate([entry.predictions, predictions]),
+        rng_state=rng.bit_generator.state,
+    )
+
+def forecast_key(symbol, bars, seed):
+    return (symbol.upper(), int(bars["datetime"][-1].astype(np.int64)), seed)
+
+async def seeded_forecast(model, scaler, symbol, bars, forecast_days, seed):
+    """
+    Deterministic forecast for `seed`, reusing cached rollouts of the same input.
+
+    A cached rollout at least `forecast_days` long is sliced; a shorter one is
+    extended from its saved state rather than recomputed.
+    """
+    window = scale_window(bars, scaler)
+    key = forecast_key(symbol, bars, seed)
+    version = _models_version
+    async with forecast_cache.lock(key):
+        entry = forecast_cache.get(key, window) or new_rollout(window, seed)
+        if entry.horizon < forecast_days:
+            with stage("inference"):
+                entry = await run_in_threadpool(extend_rollout, model, entry, forecast_days)
+            # A rollout by a model swapped out in the meantime is not kept
+            if _models is not None and _models[0] is model and _models_version == version:
+                forecast_cache.put(key, entry)
+
+    predictions_scaled = entry.predictions[:forecast_days].reshape(-1, 1)
+    return scaler.inverse_transform(predictions_scaled)[:, 0]
 
 class ForecastRequest(BaseModel):
     stock_symbol: str
     forecast_horizon: int
+    seed: Optional[int] = None  # Deterministic, cacheable jitter; unseeded requests stay random
 
 @app.post("/forecast")
-def forecast(request: ForecastRequest):
+async def forecast(request: ForecastRequest):
     if request.forecast_horizon <= 0:
         raise HTTPException(status_code=400, detail="Forecast horizon must be positive.")
+    demand.hit(("bars", request.stock_symbol.upper(), "1day"))
+    if request.seed is not None:
+        demand.hit(("forecast", request.stock_symbol.upper(), request.seed, request.forecast_horizon))
     
     try:
-        last_sequence = fetch_stock_data(request.stock_symbol)
-        future_predictions = multi_step_forecast(model, last_sequence, request.forecast_horizon, scaler)
+        model, scaler = await run_in_threadpool(load_models)
+        if request.seed is None:
+            last_sequence = await fetch_stock_data(request.stock_symbol, scaler)
+            with stage("inference"):
+                future_predictions = await run_in_threadpool(multi_step_forecast, model, last_sequence, request.forecast_horizon, scaler)
+        else:
+            bars = await fetch_stock_bars(request.stock_symbol)
+            future_predictions = await seeded_forecast(
+                model, scaler, request.stock_symbol, bars, request.forecast_horizon, request.seed
+            )
         
-        return {
+        response = {
             "stock_symbol": request.stock_symbol,
             "forecast_horizon": request.forecast_horizon,
             "predictions": future_predictions.tolist()
         }
+        if request.seed is not None:
+            response["seed"] = request.seed
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during forecasting: {e}")
 
+class BandForecastRequest(BaseModel):
+    stock_symbol: str
+    forecast_horizon: int
+    paths: int = 1000  # Jittered paths simulated together
+    percentiles: list[float] = [5, 50, 95]
+    seed: Optional[int] = None
+
+# Upper bound on paths per band request; each path is one row of every predict batch
+FORECAST_MAX_PATHS = int(os.getenv("FORECAST_MAX_PATHS", "10000"))
+
+def monte_carlo_forecast(model, last_sequence, forecast_days, scaler, paths, seed=None):
+    """
+    Simulate `paths` jittered rollouts from one window as a single batch.
+
+    Returns:
+        Prices shaped (paths, forecast_days)
+    """
+    windows = np.repeat(np.asarray(last_sequence, dtype=np.float32).reshape(1, sequence_length), paths, axis=0)
+    predictions_scaled = rollout(model, windows, forecast_days, rng=np.random.default_rng(seed))
+    return scaler.inverse_transform(predictions_scaled.reshape(-1, 1)).reshape(paths, forecast_days)
+
+@app.post("/forecast/bands")
+async def forecast_bands(request: BandForecastRequest):
+    if request.forecast_horizon <= 0:
+        raise HTTPException(status_code=400, detail="Forecast horizon must be positive.")
+    if not 1 <= request.paths <= FORECAST_MAX_PATHS:
+        raise HTTPException(status_code=400, detail=f"paths must be between 1 and {FORECAST_MAX_PATHS}.")
+    if not request.percentiles or any(not 0 <= p <= 100 for p in request.percentiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100.")
+
+    try:
+        model, scaler = await run_in_threadpool(load_models)
+        last_sequence = await fetch_stock_data(request.stock_symbol, scaler)
+        with stage("inference"):
+            paths = await run_in_threadpool(
+                monte_carlo_forecast, model, last_sequence, request.forecast_horizon, scaler, request.paths, request.seed
+            )
+        bands = np.percentile(paths, request.percentiles, axis=0)
+
+        return {
+            "stock_symbol": request.stock_symbol,
+            "forecast_horizon": request.forecast_horizon,
+            "paths": request.paths,
+            "bands": {f"p{p:g}": band.tolist() for p, band in zip(request.percentiles, bands)},
+            "mean": paths.mean(axis=0).tolist()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during band forecasting: {e}")
+
+class BatchForecastItem(BaseModel):
+    stock_symbol: str
+    forecast_horizon: int
+
+class BatchForecastRequest(BaseModel):
+    forecasts: list[BatchForecastItem]
+
+@app.post("/batch_forecast")
+async def batch_forecast(request: BatchForecastRequest):
+    if not request.forecasts:
+        raise HTTPException(status_code=400, detail="At least one forecast is required.")
+    if any(item.forecast_horizon <= 0 for item in request.forecasts):
+        raise HTTPException(status_code=400, detail="Forecast horizon must be positive.")
+
+    try:
+        # Several items may share a symbol; fetch each window only once
+        symbols = list(dict.fromkeys(item.stock_symbol for item in request.forecasts))
+        model, scaler = await run_in_threadpool(load_models)
+        windows, errors = await fetch_stock_data_batch(symbols, scaler)
+
+        results = []
+        ready = [item for item in request.forecasts if item.stock_symbol in windows]
+        if ready:
+            # One rollout to the longest horizon; shorter horizons take a prefix
+            max_horizon = max(item.forecast_horizon for item in ready)
+            batch = np.stack([windows[item.stock_symbol] for item in ready])
+            with stage("inference"):
+                future_predictions = await run_in_threadpool(multi_step_forecast, model, batch, max_horizon, scaler)
+
+            for item, predictions in zip(ready, future_predictions):
+                results.append({
+                    "stock_symbol": item.stock_symbol,
+                    "forecast_horizon": item.forecast_horizon,
+                    "predictions": predictions[:item.forecast_horizon].tolist()
+                })
+
+        return {
+            "forecasts": results,
+            "errors": errors
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during batch forecasting: {e}")
+
 def safe_float_conversion(value, default=0):
     """
     Safely convert a value to float, handling NaN and other edge cases.
@@ -279,39 +876,35 @@ def safe_float_conversion(value, default=0):
         return default
 
 @app.post("/comprehensive_analysis")
-def comprehensive_stock_analysis(request: StockAnalysisRequest):
+async def comprehensive_stock_analysis(request: StockAnalysisRequest):
+    demand.hit(("analysis", request.symbol.upper(), request.start_date, request.end_date))
     try:
-        # Fetch stock data
-        stock_data = yf.Ticker(request.symbol)
+        # Fetch info, history and recommendations concurrently, sliced from the cache when possible
+        with stage("upstream"):
+            snapshot = await fundamentals_cache.snapshot(request.symbol, request.start_date, request.end_date)
+        info = snapshot.info
+        hist = snapshot.history  # Empty DataFrame if the history fetch failed
+        analysis_started = time.perf_counter()
         
-        # Log available info keys for debugging
-        logging.info(f"Available stock info keys: {list(stock_data.info.keys())}")
-        
-        # Fetch historical market data
-        try:
-            hist = stock_data.history(start=request.start_date, end=request.end_date)
-            logging.info(f"Historical data shape: {hist.shape}")
-        except Exception as hist_error:
-            logging.error(f"Error fetching historical data: {hist_error}")
-            hist = pd.DataFrame()  # Provide an empty DataFrame to prevent further errors
+        debug_sampled(lambda: f"Stock info keys: {list(info)}, historical data shape: {hist.shape}")
         
         # Basic Financial Metrics
         analysis_results: Dict[str, Any] = {
             "basic_info": {
-                "company_name": stock_data.info.get('longName', request.symbol),
-                "sector": stock_data.info.get('sector', 'N/A'),
-                "industry": stock_data.info.get('industry', 'N/A'),
+                "company_name": info.get('longName', request.symbol),
+                "sector": info.get('sector', 'N/A'),
+                "industry": info.get('industry', 'N/A'),
             },
             "price_metrics": {
-                "current_price": safe_float_conversion(stock_data.info.get('currentPrice', 0)),
-                "fifty_two_week_high": safe_float_conversion(stock_data.info.get('fiftyTwoWeekHigh', 0)),
-                "fifty_two_week_low": safe_float_conversion(stock_data.info.get('fiftyTwoWeekLow', 0)),
+                "current_price": safe_float_conversion(info.get('currentPrice', 0)),
+                "fifty_two_week_high": safe_float_conversion(info.get('fiftyTwoWeekHigh', 0)),
+                "fifty_two_week_low": safe_float_conversion(info.get('fiftyTwoWeekLow', 0)),
             },
             "financial_health": {
-                "market_cap": safe_float_conversion(stock_data.info.get('marketCap', 0)),
-                "pe_ratio": safe_float_conversion(stock_data.info.get('trailingPE', 0)),
-                "dividend_yield": safe_float_conversion(stock_data.info.get('dividendYield', 0)),
-                "beta": safe_float_conversion(stock_data.info.get('beta', 0)),
+                "market_cap": safe_float_conversion(info.get('marketCap', 0)),
+                "pe_ratio": safe_float_conversion(info.get('trailingPE', 0)),
+                "dividend_yield": safe_float_conversion(info.get('dividendYield', 0)),
+                "beta": safe_float_conversion(info.get('beta', 0)),
             },
             "performance_analysis": {
                 "monthly_returns": [],
@@ -396,15 +989,14 @@ def comprehensive_stock_analysis(request: StockAnalysisRequest):
             recommendations = None
             
             # Method 1: Direct recommendations attribute
-            recommendations = stock_data.recommendations
+            recommendations = snapshot.recommendations
             
             # Method 2: Try recommendations from info
             if recommendations is None or (isinstance(recommendations, pd.DataFrame) and recommendations.empty):
-                recommendations = stock_data.info.get('recommendationKey', None)
+                recommendations = info.get('recommendationKey', None)
             
             # Logging for debugging
-            logging.info(f"Recommendations type: {type(recommendations)}")
-            logging.info(f"Recommendations content: {recommendations}")
+            debug_sampled(lambda: f"Recommendations ({type(recommendations).__name__}): {recommendations}")
             
             # Process recommendations if available
             if recommendations is not None and not (isinstance(recommendations, pd.DataFrame) and recommendations.empty):
@@ -439,6 +1031,7 @@ def comprehensive_stock_analysis(request: StockAnalysisRequest):
                 "sell": 0
             }
         
+        record_stage("analysis", time.perf_counter() - analysis_started)
         return analysis_results
     
     except Exception as e:
@@ -446,6 +1039,478 @@ def comprehensive_stock_analysis(request: StockAnalysisRequest):
         logging.error(f"Comprehensive analysis error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error in comprehensive analysis: {str(e)}")
 
+# Daily-return correlations over every symbol requested so far, plus CORRELATION_UNIVERSE
+CORRELATION_UNIVERSE = [s.strip().upper() for s in os.getenv("CORRELATION_UNIVERSE", "").split(",") if s.strip()]
+correlation_tracker: Optional[CorrelationTracker] = None
+# Days a stale tracked series may lag the others before its missing days are folded in without it
+CORRELATION_MAX_LAG_DAYS = int(os.getenv("CORRELATION_MAX_LAG_DAYS", "5"))
+correlation_lock = asyncio.Lock()
+
+async def sync_correlations(symbols):
+    """
+    Bring the correlation tracker up to date with the stored daily bars.
+
+    Only the requested symbols are refreshed from upstream (and only when
+    stale, see refresh_bars). The rest of the universe is read from the bar
+    store as it is and registered as demand, so the prefetcher keeps it
+    current with spare credits. New days are folded into the running
+    moments. Symbols joining the universe need their history against every
+    other symbol, so the tracker is then rebuilt from the stored bars in one
+    vectorised backfill.
+
+    Returns:
+        Tuple of (tracker, errors): errors maps symbols that could not be fetched to a message
+    """
+    global correlation_tracker
+    requested = list(dict.fromkeys(s.upper() for s in symbols))
+    for symbol in requested:
+        demand.hit(("bars", symbol, "1day"))
+    results = await asyncio.gather(*(refresh_bars(s, "1day") for s in requested), return_exceptions=True)
+    bars, errors = {}, {}
+    for symbol, result in zip(requested, results):
+        if isinstance(result, TwelveDataError):
+            errors[symbol] = f"Error fetching stock data: {result}"
+        elif isinstance(result, Exception):
+            errors[symbol] = f"Error fetching stock data from Twelve Data: {result}"
+        else:
+            bars[symbol] = result
+
+    async with correlation_lock:
+        tracked = correlation_tracker.symbols if correlation_tracker is not None else []
+        lagging = []
+        for symbol in dict.fromkeys([*tracked, *CORRELATION_UNIVERSE]):
+            if symbol in bars or symbol in errors:
+                continue
+            demand.hit(("bars", symbol, "1day"))
+            stored = bar_store.load(symbol, "1day")
+            if stored is not None and len(stored):
+                bars[symbol] = stored
+                if not series_fresh(symbol, "1day"):
+                    lagging.append(np.datetime64(stored["datetime"][-1], "D"))
+
+        def update():
+            tracker = correlation_tracker
+            if tracker is None or not set(bars) <= set(tracker.symbols):
+                tracker = CorrelationTracker(sorted(set(bars) | set(tracked)))
+            dates, closes = align_closes(bars, tracker.symbols)
+            if lagging and len(dates):
+                # Days a stale series has yet to catch up on wait for the prefetcher rather than
+                # being folded in with that symbol missing; a series further behind is not waited for
+                cutoff = max(min(lagging), dates[-1] - np.timedelta64(CORRELATION_MAX_LAG_DAYS, "D"))
+                # One day past the cutoff stays in as the unsettled day ingest leaves out
+                keep = int(np.searchsorted(dates, cutoff, side="right")) + 1
+                dates, closes = dates[:keep], closes[:keep]
+            tracker.ingest(dates, closes)
+            return tracker
+
+        with stage("analysis"):
+            correlation_tracker = await run_in_threadpool(update)
+        return correlation_tracker, errors
+
+def nullable(matrix):
+    """Nested lists with NaN as None."""
+    return [[None if np.isnan(v) else float(v) for v in row] for row in matrix]
+
+@app.post("/correlation")
+async def correlation(request: CorrelationRequest):
+    symbols = list(dict.fromkeys(s.upper() for s in request.symbols))
+    if len(symbols) < 2:
+        raise HTTPException(status_code=400, detail="At least two symbols are required.")
+
+    tracker, errors = await sync_correlations(symbols)
+    symbols = [s for s in symbols if s in tracker.index]
+    matrix, counts = tracker.submatrix(symbols, request.method, request.min_periods)
+
+    return {
+        "symbols": symbols,
+        "method": request.method,
+        "as_of": str(tracker.last_date) if tracker.last_date is not None else None,
+        "matrix": nullable(matrix),
+        "observations": counts.tolist(),
+        "errors": errors
+    }
+
+@app.post("/correlation/peers")
+async def correlation_peers(request: PeersRequest):
+    if request.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1.")
+
+    symbol = request.symbol.upper()
+    tracker, errors = await sync_correlations([symbol, *(request.universe or [])])
+    if symbol not in tracker.index:
+        raise HTTPException(status_code=404, detail=errors.get(symbol, f"No daily bars for {symbol}."))
+
+    peers = await run_in_threadpool(tracker.peers, symbol, request.k, request.min_periods)
+    return {
+        "symbol": symbol,
+        "as_of": str(tracker.last_date) if tracker.last_date is not None else None,
+        "universe_size": len(tracker.symbols),
+        "peers": [
+            {"symbol": peer, "correlation": round(value, 4), "observations": count}
+            for peer, value, count in peers
+        ],
+        "errors": errors
+    }
+
+# Optional ingest.py dataset; portfolio requests it covers are answered without yfinance
+HISTORY_DATASET = os.getenv("HISTORY_DATASET")
+
+def dataset_closes(symbols: list[str], start_date: str, end_date: str):
+    """
+    Closes of `symbols` in [start_date, end_date) memory-mapped from HISTORY_DATASET.
+
+    Returns:
+        Tuple of (dates, closes), or None if a symbol is missing or its stored
+        range does not span the request (a few days of slack cover weekends
+        and holidays at either end)
+    """
+    if not HISTORY_DATASET:
+        return None
+    partitions = read_manifest(HISTORY_DATASET)["partitions"]
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    slack = pd.Timedelta(days=5)
+    for symbol in symbols:
+        partition = partitions.get(symbol.upper())
+        if partition is None or not partition["rows"]:
+            return None
+        if pd.Timestamp(partition["first_date"]) > start + slack or pd.Timestamp(partition["last_date"]) < end - slack:
+            return None
+
+    bars = {}
+    for symbol in symbols:
+        series = load_symbol(HISTORY_DATASET, symbol, columns=["datetime", "close"])
+        lo, hi = np.searchsorted(series["datetime"], [start.to_datetime64(), end.to_datetime64()])
+        bars[symbol] = {"datetime": series["datetime"][lo:hi], "close": series["close"][lo:hi]}
+    return align_closes(bars, symbols)
+
+@app.post("/portfolio_analysis")
+async def portfolio_analysis(request: PortfolioAnalysisRequest):
+    if not request.symbols:
+        raise HTTPException(status_code=400, detail="At least one symbol is required.")
+    # yfinance and the history dataset key columns by upper-case ticker
+    symbols = [symbol.upper() for symbol in request.symbols]
+
+    if request.closes is not None:
+        closes = np.array(request.closes, dtype=float) if request.closes else np.empty((0, 0))
+        if request.dates is None or closes.shape != (len(request.dates), len(symbols)):
+            raise HTTPException(
+                status_code=400,
+                detail="closes must be a (len(dates) x len(symbols)) matrix and dates must be given."
+            )
+        dates = pd.to_datetime(request.dates).values
+        order = np.argsort(dates, kind="stable")
+        dates, closes = dates[order], closes[order]
+    else:
+        with stage("store"):
+            stored = await run_in_threadpool(dataset_closes, symbols, request.start_date, request.end_date)
+        if stored is not None:
+            dates, closes = stored
+        else:
+            try:
+                with stage("upstream"):
+                    df = await run_blocking(yf_download, symbols, start=request.start_date, end=request.end_date)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error fetching portfolio prices: {e}")
+            df = df["Close"].reindex(columns=symbols)
+            dates, closes = df.index.values, df.values
+
+    if len(closes) < 2:
+        raise HTTPException(status_code=400, detail="At least two closes per symbol are required.")
+    missing = [symbol for symbol, empty in zip(symbols, np.isnan(closes).all(axis=0)) if empty]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"No prices found for: {', '.join(missing)}")
+
+    try:
+        with stage("analysis"):
+            results = await run_in_threadpool(
+                analyse_portfolio, dates, closes, request.windows, request.risk_free_rate
+            )
+    except Exception as e:
+        logging.error(f"Portfolio analysis error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error in portfolio analysis: {e}")
+
+    def by_symbol(matrix):
+        # NaN/inf become 0 for every value at once, as safe_float_conversion does one by one
+        return dict(zip(symbols, sanitize(matrix).T.tolist()))
+
+    def per_symbol(values):
+        return dict(zip(symbols, sanitize(values).tolist()))
+
+    return {
+        "symbols": symbols,
+        "metrics": {
+            "total_return": per_symbol(results["total_return"]),
+            "volatility": per_symbol(results["volatility"]),
+            "sharpe_ratio": per_symbol(results["sharpe_ratio"]),
+            "max_drawdown": per_symbol(results["max_drawdown"]),
+        },
+        "monthly_returns": {
+            "months": [str(month) for month in results["months"]],
+            "returns": by_symbol(results["monthly_returns"]),
+        },
+        "rolling": [
+            {
+                "window": window,
+                "dates": np.datetime_as_string(rolling["dates"], unit="D").tolist(),
+                "return": by_symbol(rolling["return"]),
+                "volatility": by_symbol(rolling["volatility"]),
+                "sharpe_ratio": by_symbol(rolling["sharpe_ratio"]),
+                "max_drawdown": by_symbol(rolling["max_drawdown"]),
+            }
+            for window, rolling in results["rolling"].items()
+        ],
+    }
+
+@app.post("/warm_up")
+async def warm_up_endpoint():
+    """Explicit warm-up hook, e.g. for a scheduled ping that keeps a serverless instance hot."""
+    try:
+        timings = await run_in_threadpool(warm_up)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during warm-up: {e}")
+    return {"message": "Warm-up complete", "seconds": timings}
+
+# Fine-tuning of the served model runs in a worker process, one job at a time
+finetune_scheduler = FineTuneScheduler(workers=1)
+finetune_tasks = set()
+
+async def swap_when_finetuned(future):
+    try:
+        result = await asyncio.wrap_future(future)
+    except Exception:
+        return  # Logged by the scheduler
+    if result["updated"]:
+        try:
+            await swap_models()
+        except Exception as e:
+            logging.error(f"{MODEL_PATH} was fine-tuned but could not be reloaded: {e}")
+
+@app.post("/models/finetune", status_code=202)
+async def finetune_model(request: FineTuneRequest):
+    """Fine-tune the served model on daily bars added since its training cutoff, then swap it in."""
+    symbol = (request.symbol or read_training_meta(MODEL_PATH).get("ticker") or "").upper()
+    if not symbol:
+        raise HTTPException(status_code=400, detail="symbol is required: the model records no training ticker.")
+    if request.epochs < 1 or request.learning_rate <= 0:
+        raise HTTPException(status_code=400, detail="epochs and learning_rate must be positive.")
+
+    # Bring the stored bars up to date; the job reads them from the bar store
+    await fetch_stock_bars(symbol)
+    future, scheduled = finetune_scheduler.submit(
+        symbol, MODEL_PATH, SCALER_PATH,
+        epochs=request.epochs, learning_rate=request.learning_rate, bar_store=bar_store.root
+    )
+    if scheduled:
+        task = asyncio.create_task(swap_when_finetuned(future))
+        finetune_tasks.add(task)
+        task.add_done_callback(finetune_tasks.discard)
+    return {
+        "message": "Fine-tuning scheduled" if scheduled else "Fine-tuning already running",
+        "symbol": symbol,
+        "model_path": MODEL_PATH
+    }
+
+@app.post("/models/reload")
+async def reload_models():
+    """Serve the model files as they are on disk now, e.g. after running finetune.py or train.py."""
+    try:
+        await swap_models()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading model or scaler: {e}")
+    return {"message": "Model reloaded", "training": read_training_meta(MODEL_PATH)}
+
+@app.get("/models")
+async def models_status():
+    """The served model's training cutoff and the state of fine-tuning jobs."""
+    return {
+        "model_path": MODEL_PATH,
+        "scaler_path": SCALER_PATH,
+        "loaded": _models is not None,
+        "swapped_at": models_swapped_at,
+        "training": read_training_meta(MODEL_PATH),
+        "jobs": finetune_scheduler.status()
+    }
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "30"))
+# Credits kept for interactive requests; prefetching only spends what is above this
+PREFETCH_RESERVE_CREDITS = float(os.getenv("PREFETCH_RESERVE_CREDITS", "2"))
+# Seconds; a prefetch call queues behind every interactive one (earliest deadline first)
+PREFETCH_DEADLINE = 3600.0
+
+async def prefetch_bars(symbol: str, interval: str):
+    """Refresh a stale series, if spare Twelve Data credits allow."""
+    if bar_store.meta(symbol, interval).get("backfilled", False) and series_fresh(symbol, interval):
+        return False
+    if twelve_data_scheduler.spare_credits() < 1 + PREFETCH_RESERVE_CREDITS:
+        return False
+    await refresh_bars(symbol, interval, deadline=time.monotonic() + PREFETCH_DEADLINE)
+    return True
+
+async def prefetch_forecast(symbol: str, seed: int, horizon: int):
+    """Extend the cached seeded rollout for fresh bars to `horizon` steps."""
+    refreshed = await prefetch_bars(symbol, "1day")
+    bars = bar_store.load(symbol, "1day")
+    if bars is None or len(bars) < sequence_length or not series_fresh(symbol, "1day"):
+        return refreshed
+    model, scaler = await run_in_threadpool(load_models)
+    entry = forecast_cache.get(forecast_key(symbol, bars, seed), scale_window(bars, scaler))
+    if entry is not None and entry.horizon >= horizon:
+        return refreshed
+    await seeded_forecast(model, scaler, symbol, bars, horizon, seed)
+    return True
+
+async def prefetch_analysis(symbol: str, start_date: str, end_date: str):
+    """Fetch fundamentals again shortly before the cached ones expire."""
+    max_age = max(fundamentals_cache.ttl - 2 * PREFETCH_INTERVAL, fundamentals_cache.ttl / 2)
+    age = fundamentals_cache.age(symbol)
+    if age is not None and age < max_age:
+        return False
+    await fundamentals_cache.snapshot(symbol, start_date, end_date, max_age=max_age)
+    return True
+
+prefetcher = Prefetcher(
+    demand,
+    {"bars": prefetch_bars, "forecast": prefetch_forecast, "analysis": prefetch_analysis},
+    interval=PREFETCH_INTERVAL,
+    top_n=int(os.getenv("PREFETCH_TOP_N", "200")),
+    # Yield to requests in flight and to upstream calls waiting for credits
+    is_busy=lambda: in_flight() > 0 or twelve_data_scheduler.pending() > 0,
+)
+
+@app.get("/prefetch")
+async def prefetch_status():
+    """The hottest request targets and how many of each kind the prefetcher has warmed."""
+    return {
+        "enabled": PREFETCH_ENABLED,
+        "last_pass": prefetcher.last_pass,
+        "warmed": dict(prefetcher.stats),
+        "hottest": [{"target": list(target), "score": round(score, 3)} for target, score in demand.hottest(20)]
+    }
+
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", str(BAR_STORE_TTL)))
+STREAM_FORECAST_HORIZON = int(os.getenv("STREAM_FORECAST_HORIZON", "10"))
+# Streamed forecasts are seeded so that an unchanged input gives unchanged points
+STREAM_FORECAST_SEED = int(os.getenv("STREAM_FORECAST_SEED", "0"))
+STREAM_MAX_SYMBOLS = int(os.getenv("STREAM_MAX_SYMBOLS", "20"))
+# Seconds between SSE keep-alive comments, so idle proxies keep the connection open
+STREAM_KEEPALIVE = 15.0
+
+async def stream_poll(symbol: str):
+    # Queued behind interactive upstream calls, but due before the next poll
+    return await refresh_bars(symbol, "1day", deadline=time.monotonic() + STREAM_POLL_INTERVAL)
+
+async def stream_forecast(symbol: str, bars):
+    if len(bars) < sequence_length:
+        return None
+    model, scaler = await run_in_threadpool(load_models)
+    return await seeded_forecast(model, scaler, symbol, bars, STREAM_FORECAST_HORIZON, STREAM_FORECAST_SEED)
+
+# One poller per subscribed symbol, shared by every client following it (see streaming.py)
+stream_hub = StreamHub(
+    stream_poll,
+    stream_forecast,
+    interval=STREAM_POLL_INTERVAL,
+    snapshot_bars=int(os.getenv("STREAM_SNAPSHOT_BARS", "120")),
+)
+
+def stream_symbols(symbols):
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+    if not symbols:
+        raise HTTPException(status_code=400, detail="At least one symbol is required.")
+    if len(symbols) > STREAM_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {STREAM_MAX_SYMBOLS} symbols per stream.")
+    return symbols
+
+@app.get("/stream")
+async def stream(symbols: str):
+    """
+    Server-sent events for comma-separated `symbols`: a snapshot of each, then
+    new bars and changed forecast steps as they appear.
+    """
+    symbols = stream_symbols(symbols.split(","))
+    subscriber = stream_hub.subscriber()
+    for symbol in symbols:
+        stream_hub.subscribe(subscriber, symbol)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    kind, payload = await asyncio.wait_for(subscriber.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {kind}\ndata: {payload}\n\n"
+        finally:
+            stream_hub.drop(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/stream/ws")
+async def stream_ws(websocket: WebSocket):
+    """
+    The same messages over a WebSocket. Clients send
+    {"subscribe": [...symbols]} and {"unsubscribe": [...symbols]} at any time.
+    """
+    await websocket.accept()
+    subscriber = stream_hub.subscriber()
+
+    # The only task writing to the socket; replies to the client go through its queue too
+    async def forward():
+        while True:
+            _, payload = await subscriber.get()
+            await websocket.send_text(payload)
+
+    sender = asyncio.create_task(forward())
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                subscribe, unsubscribe = message.get("subscribe", []), message.get("unsubscribe", [])
+                if not all(isinstance(symbols, list) and all(isinstance(s, str) for s in symbols)
+                           for symbols in (subscribe, unsubscribe)):
+                    raise TypeError("Symbols must be lists of strings")
+            except (ValueError, AttributeError, TypeError):
+                stream_hub.notice(subscriber, 'Expected {"subscribe": [...]} or {"unsubscribe": [...]}.')
+                continue
+            for symbol in unsubscribe:
+                stream_hub.unsubscribe(subscriber, symbol)
+            subscribe = {s.strip().upper() for s in subscribe if s.strip()}
+            if len(subscriber.symbols | subscribe) > STREAM_MAX_SYMBOLS:
+                stream_hub.notice(subscriber, f"At most {STREAM_MAX_SYMBOLS} symbols per stream.")
+                continue
+            for symbol in sorted(subscribe):
+                stream_hub.subscribe(subscriber, symbol)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        stream_hub.drop(subscriber)
+
+@app.get("/stream/status")
+async def stream_status():
+    """Symbols being streamed and their subscriber counts."""
+    return {"poll_interval": STREAM_POLL_INTERVAL, "symbols": stream_hub.status()}
+
+@app.get("/metrics")
+async def metrics():
+    """Request and per-stage latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Start-up cost of importing this module; a regression past the budget is logged as a warning
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "1.0"))
+import_seconds = time.perf_counter() - _import_started
+if import_seconds > IMPORT_TIME_BUDGET:
+    logging.warning(f"app imported in {import_seconds:.2f}s, over the {IMPORT_TIME_BUDGET:.2f}s budget")
+else:
+    logging.info(f"app imported in {import_seconds:.2f}s")
+
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,203 @@
+"""
+Walk-forward backtest of the LSTM price forecaster.
+
+Every evaluation origin in a ticker's held-out tail gets a 1..H-step rollout
+from the 60 closes before it, exactly as `/forecast` would produce it
+(without jitter). All origins are rolled together, so each step is a few
+large `predict` calls instead of one per origin, and tickers run in parallel
+worker processes. The report gives error metrics per horizon step, a
+last-close baseline to compare against, and throughput.
+
+Usage:
+    python backtest.py MSFT_2006-01-01_to_2018-01-01.csv --horizon 10
+    python backtest.py MSFT_*.csv AAPL_*.csv --model-path "{ticker}_stock_price_prediction.pkl" \\
+        --scaler-path "{ticker}_scaler.pkl" --workers 2 --report backtest.json
+    python backtest.py MSFT AAPL --dataset history --model-path "{ticker}_stock_price_prediction.pkl" \
+        --scaler-path "{ticker}_scaler.pkl"
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+
+from forecasting import rollout
+from train import load_closes, sequence_length, ticker_from_path
+
+
+def walk_forward_windows(scaled, horizon, start, step=1):
+    """
+    Input windows and realised targets for every origin from `start` on.
+
+    Returns:
+        Tuple of (origins, windows, targets): windows is a strided
+        (origins, sequence_length) view and targets holds the next `horizon`
+        scaled closes after each origin
+    """
+    series = np.ascontiguousarray(scaled[:, 0], dtype=np.float32)
+    origins = np.arange(max(start, sequence_length), len(series) - horizon + 1, step)
+    views = np.lib.stride_tricks.sliding_window_view(series, sequence_length + horizon)
+    spans = views[origins - sequence_length]
+    return origins, spans[:, :sequence_length], spans[:, sequence_length:]
+
+
+def error_metrics(predictions, actual):
+    """MAE, RMSE and MAPE (%) for each horizon step, in price units."""
+    errors = predictions - actual
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mape = np.nanmean(np.abs(errors / actual), axis=0) * 100
+    return {
+        "mae": np.mean(np.abs(errors), axis=0).tolist(),
+        "rmse": np.sqrt(np.mean(errors ** 2, axis=0)).tolist(),
+        "mape": mape.tolist(),
+    }
+
+
+def backtest_ticker(csv_path, model_path, scaler_path, horizon=10, step=1, train_split=0.8, batch_size=4096, backend=None, dataset=None):
+    """
+    Walk-forward evaluation of one ticker over the part of its history after `train_split`.
+
+    Args:
+        csv_path: Ticker CSV with Date and Close columns
+        model_path: Pickled Keras model
+        scaler_path: Pickled MinMaxScaler fitted with the model
+        horizon: Longest rollout, in steps; every step 1..horizon is scored
+        step: Days between evaluation origins
+        train_split: Fraction of the history treated as training data and skipped
+        batch_size: Origins rolled per batch; bounds memory on long histories
+        backend: Inference backend name (see inference.py)
+        dataset: ingest.py dataset to read closes from; `csv_path` is then a ticker
+
+    Returns:
+        Dict with per-step metrics, the last-close baseline and throughput
+    """
+    import joblib
+    from inference import load_backend
+
+    ticker = ticker_from_path(csv_path)
+    model = load_backend(model_path, backend)
+    scaler = joblib.load(scaler_path)
+
+    _, closes = load_closes(csv_path, dataset)
+    scaled = scaler.transform(closes)
+    origins, windows, targets = walk_forward_windows(scaled, horizon, int(len(closes) * train_split), step)
+    if len(origins) == 0:
+        raise ValueError(f"{csv_path} has too little history for a {horizon}-step backtest")
+
+    started = time.perf_counter()
+    predictions_scaled = np.concatenate([
+        rollout(model, windows[i:i + batch_size], horizon, jitter=False, sequence_length=sequence_length)
+        for i in range(0, len(windows), batch_size)
+    ])
+    seconds = time.perf_counter() - started
+
+    def to_prices(values):
+        return scaler.inverse_transform(values.reshape(-1, 1)).reshape(values.shape)
+
+    predictions, actual = to_prices(predictions_scaled), to_prices(targets)
+    # Persistence baseline: tomorrow (and every later day) closes where today did
+    last_close = to_prices(windows[:, -1:]).repeat(horizon, axis=1)
+
+    return {
+        "ticker": ticker,
+        "model_path": model_path,
+        "origins": int(len(origins)),
+        "horizon": horizon,
+        "model": error_metrics(predictions, actual),
+        "baseline": error_metrics(last_close, actual),
+        "seconds": round(seconds, 3),
+        "forecasts_per_second": round(len(origins) / seconds, 1),
+        "steps_per_second": round(len(origins) * horizon / seconds, 1),
+    }
+
+
+def backtest_many(csv_paths, model_path, scaler_path, workers=1, **kwargs):
+    """
+    Backtest every CSV in `csv_paths`, `workers` tickers at a time.
+
+    `model_path` and `scaler_path` may contain "{ticker}" placeholders.
+    """
+    workers = max(1, min(workers, len(csv_paths)))
+    results = []
+
+    # spawn rather than fork, as in train.py, so TensorFlow-backed backends work in workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = {}
+        for csv_path in csv_paths:
+            ticker = ticker_from_path(csv_path)
+            future = pool.submit(
+                backtest_ticker,
+                csv_path,
+                model_path.format(ticker=ticker),
+                scaler_path.format(ticker=ticker),
+                **kwargs,
+            )
+            futures[future] = csv_path
+
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"Backtest failed for {futures[future]}: {e}")
+                results.append({"ticker": ticker_from_path(futures[future]), "error": str(e)})
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of LSTM price forecasters")
+    parser.add_argument("csv_paths", nargs="+", help="Kaggle-style ticker CSVs with Date and Close columns, or tickers with --dataset")
+    parser.add_argument("--dataset", default=None, help="Read closes from this ingest.py dataset")
+    parser.add_argument("--model-path", default="stock_price_prediction.pkl")
+    parser.add_argument("--scaler-path", default="scaler.pkl")
+    parser.add_argument("--horizon", type=int, default=10)
+    parser.add_argument("--step", type=int, default=1, help="Days between evaluation origins")
+    parser.add_argument("--train-split", type=float, default=0.8, help="Leading fraction of history skipped")
+    parser.add_argument("--batch-size", type=int, default=4096, help="Origins rolled per predict batch")
+    parser.add_argument("--backend", default=None, help="Inference backend; defaults to INFERENCE_BACKEND")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Tickers backtested in parallel")
+    parser.add_argument("--report", default=None, help="Write the full results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    started = time.perf_counter()
+    results = backtest_many(
+        args.csv_paths,
+        args.model_path,
+        args.scaler_path,
+        workers=args.workers,
+        horizon=args.horizon,
+        step=args.step,
+        train_split=args.train_split,
+        batch_size=args.batch_size,
+        backend=args.backend,
+        dataset=args.dataset,
+    )
+    wall = time.perf_counter() - started
+
+    for result in sorted(results, key=lambda r: r["ticker"]):
+        if "error" in result:
+            print(f"{result['ticker']}: failed ({result['error']})")
+            continue
+        model, baseline = result["model"], result["baseline"]
+        print(f"{result['ticker']}: {result['origins']} origins x {result['horizon']} steps, "
+              f"{result['forecasts_per_second']} forecasts/s ({result['steps_per_second']} steps/s)")
+        print("  step   MAE      RMSE     MAPE%   baseline MAE")
+        for h in range(result["horizon"]):
+            print(f"  {h + 1:>4}   {model['mae'][h]:<8.4f} {model['rmse'][h]:<8.4f} {model['mape'][h]:<7.3f} {baseline['mae'][h]:.4f}")
+
+    total = sum(r.get("origins", 0) for r in results)
+    print(f"{total} forecasts across {len(results)} tickers in {wall:.2f}s")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+Microbenchmarks for the backend hot paths, replayed from recorded upstream responses.
+
+Each benchmark times one hot path at several data sizes:
+
+    parse_twelve_data       Twelve Data JSON -> bars -> DataFrame (fetch_twelve_data parsing)
+    fetch_twelve_data       cold fetch into an empty bar store, upstream replayed
+    fetch_stock_data        stored bars -> scaled model window
+    multi_step_forecast     LSTM rollout, by horizon and batch size
+    mine_rules              Apriori over up/down transactions, by ticker count
+    comprehensive_analysis  /comprehensive_analysis metrics on a cached snapshot
+    portfolio_analysis      portfolio.analyse, by symbol count
+
+Upstream calls are answered from benchmark_fixtures/, so runs need no network
+or API keys and every commit sees the same data. Larger sizes are derived
+from the recorded series deterministically. Results are saved per git commit
+under .benchmarks/ and can be compared against an earlier commit, failing
+when a case got slower than the allowed threshold.
+
+Usage:
+    python benchmarks.py                          # run everything, save .benchmarks/<commit>.json
+    python benchmarks.py -k forecast --min-time 1
+    python benchmarks.py --compare HEAD~1 --threshold 0.2
+    python benchmarks.py record --symbol MSFT     # re-record fixtures (needs TWELVE_DATA_API_KEY)
+    python benchmarks.py record --from-csv MSFT_2006-01-01_to_2018-01-01.csv
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+FIXTURE_SYMBOL = "MSFT"
+
+BENCHMARKS = {}
+
+
+def benchmark(name, **params):
+    """
+    Register `func(**case)` for every combination of `params`.
+
+    `func` does its setup and returns the callable to time, or a
+    (callable, per_round_setup) pair when each round needs fresh state.
+    """
+    def register(func):
+        BENCHMARKS[name] = (func, params)
+        return func
+    return register
+
+
+# Recorded fixtures
+
+def _fixture_path(name):
+    return os.path.join(FIXTURES_DIR, name)
+
+
+def _read_fixture(name):
+    with gzip.open(_fixture_path(name), "rt") as f:
+        return json.load(f)
+
+
+def _write_fixture(name, data):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    # mtime=0 keeps re-recorded fixtures byte-identical when the data is unchanged
+    with open(_fixture_path(name), "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+        f.write(json.dumps(data, separators=(",", ":")).encode())
+
+
+def twelve_data_fixture():
+    """The recorded Twelve Data time_series response (values newest first)."""
+    return _read_fixture(f"twelve_data_{FIXTURE_SYMBOL}_1day.json.gz")
+
+
+def yfinance_fixture():
+    """The recorded yfinance info, recommendations and history."""
+    return _read_fixture(f"yfinance_{FIXTURE_SYMBOL}.json.gz")
+
+
+def twelve_data_response(bars):
+    """
+    A time_series response with `bars` daily values.
+
+    Longer series than the recording are extended into the past by replaying
+    its daily returns backwards, one business day at a time.
+    """
+    response = twelve_data_fixture()
+    values = response["values"]
+    if bars > len(values):
+        closes = np.array([float(v["close"]) for v in values])
+        ratios = closes[1:] / closes[:-1]  # newest first, so each is close[t] / close[t - 1]
+        last = values[-1]
+        dates = pd.bdate_range(end=pd.Timestamp(last["datetime"]) - pd.offsets.BDay(1), periods=bars - len(values))[::-1]
+        factor = 1.0
+        extra = []
+        for i, date in enumerate(dates):
+            factor /= ratios[i % len(ratios)]
+            extra.append({
+                "datetime": date.strftime("%Y-%m-%d"),
+                **{field: f"{float(last[field]) * factor:.4f}" for field in ("open", "high", "low", "close")},
+                "volume": last["volume"],
+            })
+        values = values + extra
+    return {**response, "values": values[:bars]}
+
+
+def closes_matrix(tickers, days):
+    """
+    (days x tickers) closes derived from the recorded series.
+
+    Each ticker mixes a little of the recorded daily returns into a shifted
+    copy of them, so the tickers are loosely correlated, as real ones are,
+    and association rules exist without every itemset being frequent.
+    """
+    bars = twelve_data_response(days + 1)["values"][::-1]
+    returns = np.diff(np.log([float(v["close"]) for v in bars]))
+    dates = pd.DatetimeIndex([v["datetime"] for v in bars[1:]])
+    columns = {}
+    for i in range(tickers):
+        mixed = 0.2 * returns + 0.8 * np.roll(returns, 17 * i + 1)
+        columns[f"T{i:03d}"] = 100 * np.exp(np.cumsum(mixed))
+    return pd.DataFrame(columns, index=dates)
+
+
+class ReplayTicker:
+    """Stands in for `yf.Ticker`, answering from the recorded yfinance fixture."""
+
+    def __init__(self, symbol):
+        recorded = yfinance_fixture()
+        self.ticker = symbol
+        self.info = recorded["info"]
+        self.recommendations = pd.DataFrame(recorded["recommendations"])
+        history = recorded["history"]
+        self._history = pd.DataFrame(
+            history["data"],
+            columns=history["columns"],
+            index=pd.DatetimeIndex(history["index"], name="Date").tz_localize(history["tz"]),
+        )
+
+    def history(self, start=None, end=None):
+        history = self._history
+        if start is not None:
+            history = history[history.index >= pd.Timestamp(start).tz_localize(history.index.tz)]
+        if end is not None:
+            history = history[history.index < pd.Timestamp(end).tz_localize(history.index.tz)]
+        return history
+
+
+# Benchmarks
+
+def _app():
+    """Import the app with its bar store in a scratch directory and no upstream rate limit."""
+    if "app" not in sys.modules:
+        os.environ.setdefault("BAR_STORE_DIR", tempfile.mkdtemp(prefix="bench_bar_store_"))
+        os.environ.setdefault("TWELVE_DATA_CREDITS_PER_MINUTE", "1000000")
+        os.environ.setdefault("WARM_UP_ON_STARTUP", "0")
+    import app
+    return app
+
+
+_loop = None
+
+
+def _run(coro):
+    """Run `coro` on one loop shared by every benchmark, as a server worker would."""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def _replay_twelve_data(app, bars):
+    response = twelve_data_response(bars)
+
+    async def http_get_json(url, params):
+        return response
+
+    app.http_get_json = http_get_json
+
+
+@benchmark("parse_twelve_data", bars=[500, 2000, 5000])
+def bench_parse_twelve_data(bars):
+    from store import to_frame
+    app = _app()
+    body = json.dumps(twelve_data_response(bars))
+    return lambda: to_frame(app.parse_series(json.loads(body), incremental=False))
+
+
+@benchmark("fetch_twelve_data", bars=[500, 5000])
+def bench_fetch_twelve_data(bars):
+    app = _app()
+    _replay_twelve_data(app, bars)
+
+    def empty_store():
+        shutil.rmtree(app.bar_store.root, ignore_errors=True)
+        os.makedirs(app.bar_store.root, exist_ok=True)
+
+    return (lambda: _run(app.fetch_twelve_data(FIXTURE_SYMBOL, "1day"))), empty_store
+
+
+@benchmark("fetch_stock_data", bars=[500, 5000])
+def bench_fetch_stock_data(bars):
+    app = _app()
+    _replay_twelve_data(app, bars)
+    app.bar_store.update(FIXTURE_SYMBOL, "1day", app.parse_series(twelve_data_response(bars), False), backfilled=True)
+    app.BAR_STORE_TTL = float("inf")  # Stored bars stay fresh, as between refreshes
+    _, scaler = app.load_models()
+    return lambda: _run(app.fetch_stock_data(FIXTURE_SYMBOL, scaler))
+
+
+@benchmark("multi_step_forecast", horizon=[10, 30, 90], batch=[1, 64])
+def bench_multi_step_forecast(horizon, batch):
+    app = _app()
+    model, scaler = app.load_models()
+    closes = np.array([float(v["close"]) for v in twelve_data_fixture()["values"][::-1]])
+    windows = np.lib.stride_tricks.sliding_window_view(closes, app.sequence_length)[-batch:]
+    scaled = scaler.transform(windows.reshape(-1, 1)).reshape(batch, app.sequence_length, 1)
+    return lambda: app.multi_step_forecast(model, scaled, horizon, scaler)
+
+
+@benchmark("mine_rules", tickers=[10, 50, 100])
+def bench_mine_rules(tickers):
+    from association import mine_rules
+    df_binary = closes_matrix(tickers, days=750).pct_change().dropna() > 0
+    return lambda: mine_rules(df_binary, 0.2, 1.0)
+
+
+@benchmark("comprehensive_analysis", years=[2, 10])
+def bench_comprehensive_analysis(years):
+    import fundamentals
+    app = _app()
+    fundamentals._ticker = ReplayTicker
+    app.fundamentals_cache.clear()
+
+    end = pd.Timestamp(yfinance_fixture()["history"]["index"][-1]) + pd.Timedelta(days=1)
+    request = app.StockAnalysisRequest(
+        symbol=FIXTURE_SYMBOL,
+        start_date=(end - pd.DateOffset(years=years)).strftime("%Y-%m-%d"),
+        end_date=end.strftime("%Y-%m-%d"),
+    )
+    # The first call fills the fundamentals cache; the timed calls measure the metrics
+    _run(app.comprehensive_stock_analysis(request))
+    return lambda: _run(app.comprehensive_stock_analysis(request))
+
+
+@benchmark("portfolio_analysis", symbols=[10, 100, 500])
+def bench_portfolio_analysis(symbols):
+    from portfolio import analyse
+    closes = closes_matrix(symbols, days=1260)
+    dates, values = closes.index.to_numpy(), closes.to_numpy()
+    return lambda: analyse(dates, values)
+
+
+# Runner
+
+def measure(func, setup=None, min_time=0.5, min_rounds=5, max_rounds=1000):
+    """
+    Time `func` until `min_time` seconds and `min_rounds` rounds have passed.
+
+    Returns:
+        Dict of timing statistics in seconds
+    """
+    if setup is not None:
+        setup()
+    func()  # Warm-up round: imports, caches, lazily loaded models
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_rounds and (len(timings) < min_rounds or time.perf_counter() - started < min_time):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "rounds": len(timings),
+    }
+
+
+def case_name(name, case):
+    return f"{name}[{','.join(f'{k}={v}' for k, v in case.items())}]" if case else name
+
+
+def run_benchmarks(selected=None, min_time=0.5, min_rounds=5):
+    """Run every registered case whose name contains one of `selected`; returns name -> stats."""
+    results = {}
+    for name, (func, params) in BENCHMARKS.items():
+        keys = list(params)
+        for combination in itertools.product(*(params[k] for k in keys)):
+            case = dict(zip(keys, combination))
+            label = case_name(name, case)
+            if selected and not any(s in label for s in selected):
+                continue
+            try:
+                prepared = func(**case)
+                timed, setup = prepared if isinstance(prepared, tuple) else (prepared, None)
+                results[label] = measure(timed, setup, min_time=min_time, min_rounds=min_rounds)
+            except Exception as e:
+                logging.error(f"Benchmark {label} failed: {e}")
+                results[label] = {"error": str(e)}
+                continue
+            stats = results[label]
+            print(f"{label:<52} {stats['min'] * 1000:>10.3f} ms min  {stats['median'] * 1000:>10.3f} ms median  ({stats['rounds']} rounds)", flush=True)
+    return results
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def results_path(revision):
+    """Path of the saved results for a git revision (any form `git rev-parse` accepts)."""
+    commit = _git("rev-parse", revision) or revision
+    return os.path.join(RESULTS_DIR, f"{commit}.json")
+
+
+def save_results(results):
+    commit = _git("rev-parse", "HEAD") or "unknown"
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Print each case's change against a saved report, by fastest round.
+
+    Returns:
+        Names of the cases more than `threshold` (a fraction) slower
+    """
+    print(f"\nCompared with {baseline['commit'][:12]} ({baseline['timestamp']}, {baseline['machine']}):")
+    regressions = []
+    for label, stats in results.items():
+        before = baseline["results"].get(label)
+        if "error" in stats or before is None or "error" in before:
+            continue
+        ratio = stats["min"] / before["min"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(label)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{label:<52} {before['min'] * 1000:>10.3f} -> {stats['min'] * 1000:>10.3f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def record(symbol, from_csv=None):
+    """
+    Record the upstream responses the benchmarks replay.
+
+    With `from_csv`, a Kaggle-style OHLCV CSV is converted into the same
+    response shapes instead, for machines without API access.
+    """
+    global FIXTURE_SYMBOL
+    FIXTURE_SYMBOL = symbol.upper()
+
+    if from_csv:
+        df = pd.read_csv(from_csv, parse_dates=["Date"]).dropna(subset=["Close"])
+        df = df.set_index("Date")[["Open", "High", "Low", "Close", "Volume"]]
+        time_series = {
+            "meta": {"symbol": FIXTURE_SYMBOL, "interval": "1day", "currency": "USD", "exchange_timezone": "America/New_York", "type": "Common Stock"},
+            "values": [
+                {
+                    "datetime": date.strftime("%Y-%m-%d"),
+                    "open": f"{row.Open:.5f}", "high": f"{row.High:.5f}", "low": f"{row.Low:.5f}",
+                    "close": f"{row.Close:.5f}", "volume": str(int(row.Volume)),
+                }
+                for date, row in df.iloc[::-1].iterrows()
+            ],
+            "status": "ok",
+        }
+        info = {"longName": FIXTURE_SYMBOL, "currentPrice": float(df["Close"].iloc[-1]),
+                "fiftyTwoWeekHigh": float(df["High"].iloc[-252:].max()), "fiftyTwoWeekLow": float(df["Low"].iloc[-252:].min())}
+        recommendations = []
+        history, tz = df, "America/New_York"
+    else:
+        import httpx
+        import yfinance as yf
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=".env.local")
+        response = httpx.get(
+            "https://api.twelvedata.com/time_series",
+            params={"symbol": FIXTURE_SYMBOL, "interval": "1day", "outputsize": 5000, "apikey": os.environ["TWELVE_DATA_API_KEY"]},
+            timeout=60,
+        )
+        response.raise_for_status()
+        time_series = response.json()
+        if "values" not in time_series:
+            raise RuntimeError(f"Twelve Data error: {time_series.get('message')}")
+
+        ticker = yf.Ticker(FIXTURE_SYMBOL)
+        info = ticker.info or {}
+        recommendations = ticker.recommendations
+        recommendations = [] if recommendations is None else recommendations.to_dict(orient="records")
+        history = ticker.history(period="max")[["Open", "High", "Low", "Close", "Volume"]]
+        tz = str(history.index.tz)
+        history = history.tz_localize(None)
+
+    _write_fixture(f"twelve_data_{FIXTURE_SYMBOL}_1day.json.gz", time_series)
+    _write_fixture(f"yfinance_{FIXTURE_SYMBOL}.json.gz", {
+        "info": json.loads(json.dumps(info, default=str)),
+        "recommendations": json.loads(json.dumps(recommendations, default=str)),
+        "history": {
+            "index": [d.strftime("%Y-%m-%d") for d in history.index],
+            "tz": tz,
+            "columns": list(history.columns),
+            "data": history.round(5).to_numpy().tolist(),
+        },
+    })
+    print(f"Recorded {len(time_series['values'])} Twelve Data bars and {len(history)} yfinance rows for {FIXTURE_SYMBOL} into {FIXTURES_DIR}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["record"]:
+        parser = argparse.ArgumentParser(prog="benchmarks.py record", description="Record the upstream fixtures the benchmarks replay")
+        parser.add_argument("--symbol", default=FIXTURE_SYMBOL)
+        parser.add_argument("--from-csv", default=None, help="Build the fixtures from a ticker CSV instead of the live APIs")
+        args = parser.parse_args(argv[1:])
+        record(args.symbol, args.from_csv)
+        return 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths against recorded upstream data")
+    parser.add_argument("-k", "--select", action="append", default=None, help="Only run cases whose name contains this (repeatable)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to keep timing each case")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--compare", default=None, metavar="REVISION", help="Compare with the saved results of a git revision")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown (fraction) counted as a regression")
+    parser.add_argument("--no-save", action="store_true", help="Do not save results for the current commit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # The app's request logging would otherwise dominate the fast cases
+    logging.getLogger().setLevel(logging.WARNING)
+
+    baseline = None
+    if args.compare:
+        # Read before saving, which would overwrite it when comparing with HEAD
+        path = results_path(args.compare)
+        if not os.path.exists(path):
+            print(f"No saved results for {args.compare} ({path})")
+            return 1
+        with open(path) as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.select, min_time=args.min_time, min_rounds=args.min_rounds)
+    if not args.no_save:
+        print(f"Saved results to {save_results(results)}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 1 if any("error" in stats for stats in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Running correlation and covariance of daily returns over a ticker universe.
+
+For every pair of tickers the tracker keeps the number of days both had a
+return, each one's mean over those days, their sums of squared deviations
+and their co-moment. A batch of days is folded in with the parallel form of
+Welford's update (Chan et al.), so a new daily bar costs O(N^2) regardless
+of history length, and a backfill is a handful of matrix products. Tickers
+missing on a day simply skip it for their pairs, so listings, delistings
+and gaps need no special handling.
+
+A top-k peer index (highest correlation first) is rebuilt lazily after
+updates, so lookups between updates are O(k).
+"""
+import threading
+
+import numpy as np
+
+# Days folded in per merge when backfilling; bounds the round-off of the batch sums
+BATCH_DAYS = 256
+# Peers kept per symbol in the precomputed index
+PEER_INDEX_SIZE = 50
+
+
+def align_closes(bars_by_symbol, symbols):
+    """
+    Daily closes of `symbols` on the union of their trading days.
+
+    Args:
+        bars_by_symbol: Symbol -> stored bars (see store.BAR_DTYPE); missing symbols stay NaN
+        symbols: Column order
+
+    Returns:
+        Tuple of (dates, closes): ascending datetime64 days and a (days x symbols) matrix
+    """
+    present = [bars_by_symbol[s] for s in symbols if s in bars_by_symbol]
+    if not present:
+        return np.empty(0, dtype="datetime64[D]"), np.empty((0, len(symbols)))
+    dates = np.unique(np.concatenate([np.asarray(b["datetime"], dtype="datetime64[D]") for b in present]))
+
+    closes = np.full((len(dates), len(symbols)), np.nan)
+    for column, symbol in enumerate(symbols):
+        bars = bars_by_symbol.get(symbol)
+        if bars is not None and len(bars):
+            rows = np.searchsorted(dates, np.asarray(bars["datetime"], dtype="datetime64[D]"))
+            closes[rows, column] = bars["close"]
+    return dates, closes
+
+
+class PairwiseMoments:
+    """
+    Pairwise return moments for `n_symbols` tickers.
+
+    Entry [i, j] of `mean` and `m2` describes ticker i over the days both i
+    and j had a return; their transposes describe ticker j over the same days.
+    """
+
+    def __init__(self, n_symbols):
+        shape = (n_symbols, n_symbols)
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.comoment = np.zeros(shape)
+
+    def update(self, returns):
+        """Fold in a (days x symbols) block of returns; NaN marks a missing return."""
+        returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+        for start in range(0, len(returns), BATCH_DAYS):
+            self._merge(returns[start:start + BATCH_DAYS])
+
+    def _merge(self, block):
+        valid = ~np.isnan(block)
+        weights = valid.astype(np.float64)
+        values = np.where(valid, block, 0.0)
+
+        # Moments of the block alone, per pair, over the days both tickers are present
+        count_b = weights.T @ weights
+        sums = values.T @ weights
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(count_b > 0, sums / count_b, 0.0)
+        m2_b = (values ** 2).T @ weights - sums * mean_b
+        comoment_b = values.T @ values - sums * mean_b.T
+
+        # Chan et al.'s combination of two sets of moments; with one day it is Welford's update
+        count = self.count + count_b
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share_b = np.where(count > 0, count_b / count, 0.0)
+        delta = mean_b - self.mean
+        cross = self.count * share_b  # count_a * count_b / count
+        self.mean += delta * share_b
+        self.m2 += m2_b + delta ** 2 * cross
+        self.comoment += comoment_b + delta * delta.T * cross
+        self.count = count
+
+    def covariance(self, min_periods=2):
+        """Sample covariance matrix; NaN for pairs with fewer than `min_periods` common days."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = self.comoment / (self.count - 1)
+        covariance[self.count < max(min_periods, 2)] = np.nan
+        return covariance
+
+    def correlation(self, min_periods=2):
+        """Pearson correlation matrix; NaN for short or constant pairs."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        correlation[(self.count < max(min_periods, 2)) | ~np.isfinite(correlation)] = np.nan
+        return np.clip(correlation, -1.0, 1.0)
+
+
+class CorrelationTracker:
+    """
+    Return moments of a fixed list of symbols, fed with daily closes as they arrive.
+
+    Only settled days are folded in: the newest day of each update may still
+    be a forming bar, so it waits until a later day follows it.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.moments = PairwiseMoments(len(self.symbols))
+        self.last_date = None
+        self.last_close = np.full(len(self.symbols), np.nan)
+        self._peers = None
+        self._lock = threading.Lock()
+
+    def ingest(self, dates, closes):
+        """
+        Fold in the settled days of `dates` after the last one ingested.
+
+        Args:
+            dates: Ascending datetime64 days
+            closes: (days x symbols) closes in `self.symbols` order, NaN where missing
+
+        Returns:
+            Number of days folded in
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        closes = np.asarray(closes, dtype=np.float64)
+        settled = len(dates) - 1
+        if settled < 1:
+            return 0
+
+        start = 0
+        previous = None
+        if self.last_date is not None:
+            start = int(np.searchsorted(dates, self.last_date, side="left"))
+            if start < len(dates) and dates[start] == self.last_date:
+                previous = closes[start]
+                start += 1
+            else:
+                previous = self.last_close
+        if start >= settled:
+            return 0
+
+        rows = closes[start:settled]
+        if previous is None:
+            previous, rows, start = rows[0], rows[1:], start + 1
+        prior = np.vstack([previous, rows[:-1]]) if len(rows) else np.empty((0, len(self.symbols)))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # A return needs closes on both days; anything else is missing
+            returns = rows / prior - 1
+
+        with self._lock:
+            if len(returns):
+                self.moments.update(returns)
+                self._peers = None
+            self.last_date = dates[settled - 1]
+            self.last_close = closes[settled - 1].copy()
+        return len(returns)
+
+    def submatrix(self, symbols, method="correlation", min_periods=2):
+        """Correlation or covariance matrix and common-day counts for `symbols`."""
+        rows = [self.index[s] for s in symbols]
+        with self._lock:
+            matrix = self.moments.correlation(min_periods) if method == "correlation" else self.moments.covariance(min_periods)
+            count = self.moments.count
+        return matrix[np.ix_(rows, rows)], count[np.ix_(rows, rows)].astype(np.int64)
+
+    def _peer_index(self, min_periods):
+        """(ranked peer indices, their correlations) for every symbol, built once per update."""
+        if self._peers is None or self._peers[0] != min_periods:
+            correlation = self.moments.correlation(min_periods)
+            np.fill_diagonal(correlation, np.nan)
+            scores = np.where(np.isnan(correlation), -np.inf, correlation)
+            k = min(PEER_INDEX_SIZE, max(len(self.symbols) - 1, 0))
+            if k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+                top = np.take_along_axis(top, order, axis=1)
+            else:
+                top = np.empty((len(self.symbols), 0), dtype=np.int64)
+            self._peers = (min_periods, top, np.take_along_axis(scores, top, axis=1))
+        return self._peers[1:]
+
+    def peers(self, symbol, k=10, min_periods=2):
+        """
+        The `k` symbols most correlated with `symbol`, highest first.
+
+        Returns:
+            List of (symbol, correlation, common days); pairs below
+            `min_periods` are left out
+        """
+        row = self.index[symbol]
+        with self._lock:
+            if k > PEER_INDEX_SIZE:
+                # Beyond the index, rank this one row directly
+                correlation = self.moments.correlation(min_periods)[row]
+                correlation[row] = np.nan
+                scores = np.where(np.isnan(correlation), -np.inf, correlation)
+                top = np.argsort(-scores, kind="stable")[:k]
+                values = scores[top]
+            else:
+                top, values = (a[row][:k] for a in self._peer_index(min_periods))
+            counts = self.moments.count[row]
+        return [
+            (self.symbols[j], float(value), int(counts[j]))
+            for j, value in zip(top, values)
+            if np.isfinite(value)
+        ]
@@ -0,0 +1,123 @@
+"""
+Streaming serialisers for stored OHLCV bars.
+
+Each `iter_*` generator walks a (possibly memory-mapped) bar array in
+fixed-size chunks and yields encoded bytes, so a response starts as soon as
+the first chunk is ready and memory stays flat regardless of the range size.
+"""
+import io
+import json
+
+import numpy as np
+
+from store import to_frame
+
+# API column name -> bar field
+EXPORT_COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Volume": "volume",
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def resolve_columns(columns):
+    """
+    Map requested column names (case-insensitive) to export columns.
+
+    Raises:
+        ValueError: If a column is unknown
+    """
+    if not columns:
+        return list(EXPORT_COLUMNS)
+    by_lower = {name.lower(): name for name in EXPORT_COLUMNS}
+    unknown = [c for c in columns if c.lower() not in by_lower]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}. Choose from {list(EXPORT_COLUMNS)}")
+    return [by_lower[c.lower()] for c in columns]
+
+
+def bar_range(bars, start_date=None, end_date=None):
+    """Slice of the bars with start_date <= datetime <= end_date; either bound may be omitted."""
+    timestamps = bars["datetime"]
+    lo = np.searchsorted(timestamps, np.datetime64(start_date, "ns"), side="left") if start_date else 0
+    hi = np.searchsorted(timestamps, np.datetime64(end_date, "ns"), side="right") if end_date else len(bars)
+    return slice(lo, hi)
+
+
+def to_export_frame(bars, columns, extra=None):
+    """`to_frame` restricted to `columns`, with `extra` columns (name -> array aligned with bars) appended."""
+    frame = to_frame(bars)[columns]
+    for name, values in (extra or {}).items():
+        frame[name] = values
+    return frame
+
+
+def _chunks(bars, chunk_size, extra=None):
+    extra = extra or {}
+    for start in range(0, len(bars), chunk_size):
+        end = start + chunk_size
+        yield bars[start:end], {name: values[start:end] for name, values in extra.items()}
+
+
+def iter_csv(bars, columns, extra=None, chunk_size=1000):
+    """CSV in the same layout as the legacy `csv_data` payload, header first."""
+    for i, (chunk, chunk_extra) in enumerate(_chunks(bars, chunk_size, extra)):
+        yield to_export_frame(chunk, columns, chunk_extra).to_csv(header=(i == 0)).encode()
+    if len(bars) == 0:
+        yield ",".join(["Date"] + columns + list(extra or {})).encode() + b"\n"
+
+
+def iter_ndjson(bars, columns, extra=None, chunk_size=1000):
+    """One JSON object per bar, ISO-8601 `Date` first."""
+    fields = [EXPORT_COLUMNS[c] for c in columns]
+    for chunk, chunk_extra in _chunks(bars, chunk_size, extra):
+        dates = np.datetime_as_string(chunk["datetime"], unit="s")
+        names = columns + list(chunk_extra)
+        values = [chunk[field].tolist() for field in fields]
+        values += [np.asarray(v, dtype=np.float64).tolist() for v in chunk_extra.values()]
+        lines = []
+        for row, date in enumerate(dates.tolist()):
+            record = {"Date": date}
+            for column, column_values in zip(names, values):
+                value = column_values[row]
+                # NaN is not valid JSON
+                record[column] = None if value != value else value
+            lines.append(json.dumps(record))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def iter_arrow(bars, columns, extra=None, chunk_size=10000):
+    """Arrow IPC stream, one record batch per chunk."""
+    import pyarrow as pa
+
+    names = columns + list(extra or {})
+    schema = pa.schema(
+        [pa.field("Date", pa.timestamp("ns"))] + [pa.field(c, pa.float64()) for c in names]
+    )
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk, chunk_extra in _chunks(bars, chunk_size, extra):
+            arrays = [pa.array(np.ascontiguousarray(chunk["datetime"]))]
+            arrays += [pa.array(np.ascontiguousarray(chunk[EXPORT_COLUMNS[c]])) for c in columns]
+            arrays += [pa.array(np.ascontiguousarray(v, dtype=np.float64)) for v in chunk_extra.values()]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            # Hand off what has been written so far and reuse the buffer
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+SERIALISERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "arrow": iter_arrow,
+}
@@ -0,0 +1,265 @@
+"""
+Warm-start fine-tuning of trained LSTM forecasters on bars added since their
+training cutoff.
+
+Each model's `.training.json` sidecar (written by train.py) records the last
+bar it was trained on. A fine-tuning job loads the model and its scaler,
+trains for a few epochs at a low learning rate on the windows whose target is
+a newer bar, and moves the cutoff forward. The scaler is kept as fitted so
+the model's inputs keep their meaning. The model, its NumPy weights and the
+sidecar are written to temporary files and renamed into place, so a server
+loading them sees either the old model or the new one.
+
+`FineTuneScheduler` runs jobs on a process pool, one at a time per model
+file; app.py uses it to fine-tune the served model and swap it in without a
+restart.
+
+Usage:
+    python finetune.py MSFT_2006-01-01_to_2019-01-01.csv --model-path stock_price_prediction.pkl \\
+        --scaler-path scaler.pkl
+    python finetune.py MSFT AAPL --dataset history --model-path "{ticker}_stock_price_prediction.pkl" \\
+        --scaler-path "{ticker}_scaler.pkl" --workers 2
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from train import (evaluate, load_closes, make_dataset, make_windows, read_training_meta, sequence_length,
+                   ticker_from_path, write_training_meta)
+
+
+def load_settled_bars(bar_store_root, ticker, interval="1day"):
+    """
+    Dates and closes of a ticker from an app bar store, without the newest bar.
+
+    The newest stored bar may still be forming, so it is left for a later run.
+    """
+    from store import BarStore
+
+    bars = BarStore(bar_store_root).load(ticker, interval)
+    if bars is None or len(bars) < 2:
+        raise ValueError(f"No stored {interval} bars for {ticker} in {bar_store_root}")
+    bars = bars[:-1]
+    return bars["datetime"].astype("datetime64[D]"), np.asarray(bars["close"], dtype=np.float64).reshape(-1, 1)
+
+
+def finetune_ticker(source, model_path, scaler_path, epochs=5, batch_size=32, learning_rate=1e-4, cutoff=None,
+                    dataset=None, bar_store=None, threads=None, seed=None):
+    """
+    Fine-tune one ticker's model on the bars after its training cutoff.
+
+    Args:
+        source: Ticker CSV, or a ticker with `dataset` or `bar_store`
+        model_path: Pickled Keras model, updated in place
+        scaler_path: Pickled MinMaxScaler fitted with the model; not changed
+        epochs: Passes over the new windows
+        batch_size: Windows per training batch
+        learning_rate: Adam learning rate; low, to adjust rather than retrain the weights
+        cutoff: Last bar already trained on (YYYY-MM-DD); defaults to the model's sidecar
+        dataset: ingest.py dataset to read closes from
+        bar_store: app.py bar store directory to read daily closes from
+        threads: Cap on TensorFlow's thread pools
+        seed: Seed for shuffling and weight noise
+
+    Returns:
+        Dict with the new bars used and the error on them before and after
+    """
+    import joblib
+
+    started = time.perf_counter()
+    ticker = ticker_from_path(source)
+    meta = read_training_meta(model_path)
+    cutoff = cutoff or meta.get("cutoff")
+    if cutoff is None:
+        raise ValueError(f"{model_path} has no training cutoff recorded; pass one explicitly")
+
+    if bar_store is not None:
+        dates, closes = load_settled_bars(bar_store, ticker)
+    else:
+        dates, closes = load_closes(source, dataset)
+    dates = np.asarray(dates).astype("datetime64[D]")
+
+    # Windows whose target (the bar after the window) is newer than the cutoff
+    first_new = int(np.searchsorted(dates, np.datetime64(cutoff, "D"), side="right"))
+    result = {"ticker": ticker, "model_path": model_path, "cutoff": cutoff, "new_bars": int(len(dates) - first_new)}
+    if first_new >= len(dates) or len(dates) <= sequence_length:
+        result.update(updated=False, seconds=round(time.perf_counter() - started, 2))
+        return result
+
+    import tensorflow as tf
+    from inference import extract_layers, fingerprint, save_layers
+
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    if seed is not None:
+        tf.keras.utils.set_random_seed(seed)
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    X, y = make_windows(scaler.transform(closes))
+    indices = np.arange(max(first_new - sequence_length, 0), len(X))
+
+    mae_before, rmse_before = evaluate(model, X, y, indices, scaler)
+    # A fresh optimizer at a low rate; the pickled one's state belongs to the original run
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), loss='mean_squared_error')
+    model.fit(make_dataset(X, y, indices, batch_size, shuffle=True, seed=seed), epochs=epochs, shuffle=False, verbose=0)
+    mae_after, rmse_after = evaluate(model, X, y, indices, scaler)
+
+    # Model, then its NumPy weights, then the sidecar, each renamed into place. A reader
+    # between the first two renames sees stale weights and re-exports them from the new model.
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    source_fingerprint = fingerprint(tmp_path)
+    os.replace(tmp_path, model_path)
+    save_layers(extract_layers(model), os.path.splitext(model_path)[0] + ".npz", source_fingerprint)
+    new_cutoff = str(dates[-1])
+    write_training_meta(model_path, {
+        **meta,
+        "ticker": meta.get("ticker", ticker),
+        "cutoff": new_cutoff,
+        "finetuned_at": time.time(),
+        "finetune_samples": int(len(indices)),
+        "finetune_epochs": epochs,
+    })
+
+    result.update(
+        updated=True,
+        new_cutoff=new_cutoff,
+        samples=int(len(indices)),
+        mae_before=mae_before,
+        rmse_before=rmse_before,
+        mae=mae_after,
+        rmse=rmse_after,
+        seconds=round(time.perf_counter() - started, 2),
+    )
+    return result
+
+
+class FineTuneScheduler:
+    """
+    Fine-tuning jobs on a process pool, at most one in flight per model file.
+
+    Submitting for a model that already has a job queued or running returns
+    that job's future instead of starting a second one that would race it
+    for the same files.
+
+    Args:
+        workers: Jobs run in parallel
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self._pool = None
+        self._jobs = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn rather than fork: TensorFlow does not survive being forked
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        return self._pool
+
+    def submit(self, source, model_path, scaler_path, **kwargs):
+        """
+        Schedule `finetune_ticker` for `model_path`.
+
+        Returns:
+            Tuple of (future, scheduled): scheduled is False if an earlier
+            job for the same model was returned instead
+        """
+        with self._lock:
+            future = self._jobs.get(model_path)
+            if future is not None and not future.done():
+                return future, False
+            kwargs.setdefault("threads", max(1, (os.cpu_count() or 1) // self.workers))
+            future = self._executor().submit(finetune_ticker, source, model_path, scaler_path, **kwargs)
+            self._jobs[model_path] = future
+            future.add_done_callback(lambda done: self._finished(model_path, source, done))
+            return future, True
+
+    def _finished(self, model_path, source, future):
+        try:
+            outcome = future.result()
+        except Exception as e:
+            logging.error(f"Fine-tuning failed for {model_path}: {e}")
+            outcome = {"ticker": ticker_from_path(source), "model_path": model_path, "error": str(e)}
+        with self._lock:
+            self._last[model_path] = {**outcome, "finished_at": time.time()}
+
+    def status(self):
+        """Per model file: whether a job is running and the outcome of the last one."""
+        with self._lock:
+            models = set(self._jobs) | set(self._last)
+            return {
+                path: {
+                    "running": path in self._jobs and not self._jobs[path].done(),
+                    "last": self._last.get(path),
+                }
+                for path in sorted(models)
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune trained LSTM forecasters on bars added since their cutoff")
+    parser.add_argument("sources", nargs="+", help="Ticker CSVs, or tickers with --dataset or --bar-store")
+    parser.add_argument("--dataset", default=None, help="Read closes from this ingest.py dataset")
+    parser.add_argument("--bar-store", default=None, help="Read daily closes from this app.py bar store")
+    parser.add_argument("--model-path", default="{ticker}_stock_price_prediction.pkl")
+    parser.add_argument("--scaler-path", default="{ticker}_scaler.pkl")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    parser.add_argument("--cutoff", default=None, help="Last bar already trained on; defaults to the model's sidecar")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Tickers fine-tuned in parallel")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if len(args.sources) > 1 and ("{ticker}" not in args.model_path or "{ticker}" not in args.scaler_path):
+        parser.error("Fine-tuning several tickers needs '{ticker}' in --model-path and --scaler-path")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    scheduler = FineTuneScheduler(workers=min(args.workers, len(args.sources)))
+    for source in args.sources:
+        ticker = ticker_from_path(source)
+        scheduler.submit(
+            source,
+            args.model_path.format(ticker=ticker),
+            args.scaler_path.format(ticker=ticker),
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            learning_rate=args.learning_rate,
+            cutoff=args.cutoff,
+            dataset=args.dataset,
+            bar_store=args.bar_store,
+            seed=args.seed,
+        )
+    scheduler.shutdown(wait=True)
+
+    results = [job["last"] for job in scheduler.status().values()]
+    for result in sorted(results, key=lambda r: r["ticker"]):
+        if "error" in result:
+            print(f"{result['ticker']}: failed ({result['error']})")
+        elif not result["updated"]:
+            print(f"{result['ticker']}: up to date (cutoff {result['cutoff']})")
+        else:
+            print(f"{result['ticker']}: {result['new_bars']} new bars, MAE {result['mae_before']:.4f} -> "
+                  f"{result['mae']:.4f} -> {result['model_path']} (cutoff {result['new_cutoff']})")
+    return results
+
+
+if __name__ == "__main__":
+    main()
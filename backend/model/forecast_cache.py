@@ -0,0 +1,78 @@
+"""
+Cache of seeded forecast rollouts.
+
+A seeded forecast is a pure function of the input window, the model and the
+seed, so its rollout can be reused. Entries are keyed by (symbol, last bar
+timestamp, seed) and keep the scaled rollout plus the state of the jitter
+generator after its last step: a shorter horizon is served from the prefix,
+and a longer one continues from the cached state, giving exactly the values
+a single longer rollout would have produced.
+"""
+import asyncio
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class CachedRollout:
+    window: np.ndarray  # Scaled input window the rollout started from
+    predictions: np.ndarray  # Scaled predictions so far, one per step
+    rng_state: dict  # Jitter generator state after the last prediction
+
+    @property
+    def horizon(self):
+        return len(self.predictions)
+
+    def generator(self):
+        """A jitter generator positioned after the last cached step."""
+        rng = np.random.Generator(np.random.PCG64())
+        rng.bit_generator.state = self.rng_state
+        return rng
+
+
+def new_rollout(window, seed):
+    """An empty rollout for `window` whose jitter stream starts from `seed`."""
+    return CachedRollout(
+        window=np.asarray(window, dtype=np.float32).reshape(-1),
+        predictions=np.empty(0, dtype=np.float32),
+        rng_state=np.random.default_rng(seed).bit_generator.state,
+    )
+
+
+class ForecastCache:
+    """LRU of seeded rollouts with one lock per key, so concurrent callers compute once."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # A key's lock lives only while some caller holds or awaits it, so locks for
+        # keys of past bars do not accumulate
+        self._locks = weakref.WeakValueDictionary()
+
+    def lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def get(self, key, window):
+        """The cached rollout for `key`, or None; an entry for a different (revised) window is a miss."""
+        entry = self._entries.get(key)
+        if entry is None or not np.array_equal(entry.window, np.asarray(window, dtype=np.float32).reshape(-1)):
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        # Fresh containers: callers still waiting on a pre-clear lock keep it to themselves
+        self._entries = OrderedDict()
+        self._locks = weakref.WeakValueDictionary()
@@ -0,0 +1,48 @@
+"""
+Autoregressive rollouts shared by the API and the backtester.
+
+A rollout feeds each step's prediction back in as the newest value of the
+next step's input window. Every window in the batch advances together, so
+each step is one `predict` call however many windows or paths are rolled.
+"""
+import random
+
+import numpy as np
+
+
+def rollout(model, windows, forecast_days, rngs=None, rng=None, jitter=True, sequence_length=60):
+    """
+    Autoregressive rollout in scaled space.
+
+    `windows` is shaped (N, sequence_length). Each step runs a single predict
+    call over the whole batch. Jitter comes from `random` unless `rngs` gives
+    one NumPy generator per row, which makes the rollout reproducible, or
+    `rng` draws every row's jitter in one vectorised call. `jitter=False`
+    rolls the bare model predictions, as the backtester evaluates them.
+
+    Returns:
+        Scaled predictions shaped (N, forecast_days)
+    """
+    windows = np.asarray(windows, dtype=np.float32).reshape(-1, sequence_length)
+    batch_size = windows.shape[0]
+
+    # Preallocate the whole rollout; each step's input is a sliding view instead of a rebuilt array
+    sequence = np.empty((batch_size, sequence_length + forecast_days), dtype=np.float32)
+    sequence[:, :sequence_length] = windows
+
+    for step in range(forecast_days):
+        current_input = sequence[:, step:step + sequence_length, np.newaxis]
+        pred_scaled = np.asarray(model.predict(current_input))[:, 0]
+
+        # Add slight randomness to prevent a strict downtrend
+        if not jitter:
+            random_factor = 1.0
+        elif rng is not None:
+            random_factor = rng.uniform(0.98, 1.02, batch_size)
+        elif rngs is None:
+            random_factor = np.array([random.uniform(0.98, 1.02) for _ in range(batch_size)])  # Adjust within a 2% range
+        else:
+            random_factor = np.array([row_rng.uniform(0.98, 1.02) for row_rng in rngs])
+        sequence[:, sequence_length + step] = pred_scaled * random_factor
+
+    return sequence[:, sequence_length:]
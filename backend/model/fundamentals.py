@@ -0,0 +1,163 @@
+"""
+Memoized yfinance fundamentals for the analysis endpoints.
+
+Each ticker's `info`, `recommendations` and a history window are fetched once
+and kept in a TTL + LRU cache. History requests inside an already cached date
+range are answered by slicing it; requests outside it refetch the union of
+both ranges so the cache keeps growing into a superset. The blocking
+yfinance calls run on the upstream thread pool, concurrently where they are
+independent.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+from upstream import run_blocking
+
+
+@dataclass
+class FundamentalsSnapshot:
+    """Everything `/comprehensive_analysis` needs about one ticker."""
+    symbol: str
+    info: dict
+    history: pd.DataFrame
+    recommendations: object = None
+
+
+@dataclass
+class _CacheEntry:
+    info: dict
+    recommendations: object
+    fetched_at: float
+    history: pd.DataFrame = None
+    history_start: pd.Timestamp = None
+    history_end: pd.Timestamp = None
+
+
+def _ticker(symbol):
+    # yfinance is imported on first use, off the event loop, to keep app start-up fast
+    import yfinance as yf
+    return yf.Ticker(symbol)
+
+
+def _slice_history(history, start, end):
+    """Rows with start <= date < end, matching yfinance's exclusive `end`."""
+    if history.empty:
+        return history
+    tz = history.index.tz
+    start = start.tz_localize(tz) if tz is not None else start
+    end = end.tz_localize(tz) if tz is not None else end
+    return history[(history.index >= start) & (history.index < end)]
+
+
+class FundamentalsCache:
+    """TTL + LRU cache of per-ticker fundamentals snapshots."""
+
+    def __init__(self, ttl=900, max_symbols=256):
+        self.ttl = ttl
+        self.max_symbols = max_symbols
+        self._entries = OrderedDict()
+        self._locks = {}
+
+    def _cached(self, symbol, max_age=None):
+        entry = self._entries.get(symbol)
+        # max_age=0 means always refetch, so test for None rather than truthiness
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        if entry is not None and time.time() - entry.fetched_at < ttl:
+            self._entries.move_to_end(symbol)
+            return entry
+        return None
+
+    def _store(self, symbol, entry):
+        self._entries[symbol] = entry
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_symbols:
+            evicted, _ = self._entries.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    async def _fetch_info(self, symbol):
+        ticker = await run_blocking(_ticker, symbol)
+        info, recommendations = await asyncio.gather(
+            run_blocking(lambda: ticker.info or {}),
+            self._fetch_recommendations(ticker),
+        )
+        return _CacheEntry(info=info, recommendations=recommendations, fetched_at=time.time())
+
+    @staticmethod
+    async def _fetch_recommendations(ticker):
+        try:
+            return await run_blocking(lambda: ticker.recommendations)
+        except Exception as rec_error:
+            logging.warning(f"Could not fetch analyst recommendations for {ticker.ticker}: {rec_error}")
+            return None
+
+    @staticmethod
+    async def _fetch_history(symbol, start, end):
+        """Fetch history for [start, end); None if the fetch failed."""
+        try:
+            return await run_blocking(
+                lambda: _ticker(symbol).history(
+                    start=start.strftime("%Y-%m-%d"),
+                    end=end.strftime("%Y-%m-%d"),
+                )
+            )
+        except Exception as hist_error:
+            logging.error(f"Error fetching historical data: {hist_error}")
+            return None
+
+    def age(self, symbol):
+        """Seconds since `symbol` was fetched, or None if it is not cached."""
+        entry = self._entries.get(symbol.upper())
+        return None if entry is None else time.time() - entry.fetched_at
+
+    async def snapshot(self, symbol, start_date, end_date, max_age=None):
+        """
+        Return the fundamentals snapshot for `symbol` over [start_date, end_date).
+
+        On a cold miss info, recommendations and history are fetched
+        concurrently. An empty history is returned if that fetch fails; the
+        cache is left untouched so the next request retries it.
+
+        Args:
+            symbol: Ticker symbol
+            start_date: Inclusive start, YYYY-MM-DD
+            end_date: Exclusive end, YYYY-MM-DD
+            max_age: Refetch entries older than this many seconds, even within the TTL
+        """
+        symbol = symbol.upper()
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+        # Concurrent requests for one symbol wait for a single fetch
+        async with self._locks.setdefault(symbol, asyncio.Lock()):
+            entry = self._cached(symbol, max_age)
+            if entry is None:
+                entry, history = await asyncio.gather(
+                    self._fetch_info(symbol),
+                    self._fetch_history(symbol, start, end),
+                )
+                if history is not None:
+                    entry.history, entry.history_start, entry.history_end = history, start, end
+                self._store(symbol, entry)
+            elif entry.history is not None and entry.history_start <= start and end <= entry.history_end:
+                history = entry.history
+            else:
+                fetch_start, fetch_end = start, end
+                if entry.history is not None:
+                    fetch_start, fetch_end = min(start, entry.history_start), max(end, entry.history_end)
+                history = await self._fetch_history(symbol, fetch_start, fetch_end)
+                if history is not None:
+                    entry.history, entry.history_start, entry.history_end = history, fetch_start, fetch_end
+
+        return FundamentalsSnapshot(
+            symbol=symbol,
+            info=entry.info,
+            history=_slice_history(history, start, end) if history is not None else pd.DataFrame(),
+            recommendations=entry.recommendations,
+        )
+
+    def clear(self):
+        self._entries.clear()
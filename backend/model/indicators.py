@@ -0,0 +1,323 @@
+"""
+Incremental technical indicators over stored bars.
+
+Each indicator can backfill a whole close series with vectorised pandas ops
+and can then advance its running state by one close in O(1). The engine
+keeps one state per (symbol, interval, indicator). When the bar store hands
+back a series that only revised its last bar and appended a few new ones,
+just those bars are stepped; anything else (first request, rewritten
+history) is a full vectorised backfill.
+
+Indicator specs are strings such as "sma_20", "ema_50", "rsi_14", "macd"
+(or "macd_12_26_9") and "bbands_20_2"; missing parameters take defaults.
+"""
+import copy
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Beyond this many new bars a vectorised recompute is cheaper than stepping
+MAX_INCREMENTAL_BARS = 256
+
+
+def _ewm(values, alpha):
+    """Recursive EMA seeded with the first value (pandas `adjust=False`)."""
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def _ema_step(state, value, alpha):
+    state["value"] = value if state["count"] == 0 else state["value"] + alpha * (value - state["value"])
+    state["count"] += 1
+    return state["value"]
+
+
+class SMA:
+    def __init__(self, period=20):
+        self.period = int(period)
+        self.columns = [f"SMA_{self.period}"]
+
+    def backfill(self, closes):
+        sma = pd.Series(closes).rolling(self.period).mean().to_numpy()
+        window = closes[-self.period:]
+        state = {"window": list(window), "sum": float(np.sum(window))}
+        return sma[:, np.newaxis], state
+
+    def step(self, state, close):
+        window = state["window"]
+        window.append(close)
+        state["sum"] += close
+        if len(window) > self.period:
+            state["sum"] -= window.pop(0)
+        return [state["sum"] / self.period if len(window) == self.period else math.nan]
+
+
+class EMA:
+    def __init__(self, period=20):
+        self.period = int(period)
+        self.alpha = 2 / (self.period + 1)
+        self.columns = [f"EMA_{self.period}"]
+
+    def backfill(self, closes):
+        ema = _ewm(closes, self.alpha)
+        state = {"value": float(ema[-1]) if len(ema) else 0.0, "count": len(closes)}
+        ema[:self.period - 1] = np.nan
+        return ema[:, np.newaxis], state
+
+    def step(self, state, close):
+        value = _ema_step(state, close, self.alpha)
+        return [value if state["count"] >= self.period else math.nan]
+
+
+class RSI:
+    """Wilder's RSI: gains and losses smoothed with alpha = 1 / period."""
+
+    def __init__(self, period=14):
+        self.period = int(period)
+        self.alpha = 1 / self.period
+        self.columns = [f"RSI_{self.period}"]
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+
+    def backfill(self, closes):
+        deltas = np.diff(closes)
+        gain = _ewm(np.maximum(deltas, 0), self.alpha)
+        loss = _ewm(np.maximum(-deltas, 0), self.alpha)
+        rsi = np.concatenate([[np.nan], self._rsi(gain, loss)])[:len(closes)]
+        rsi[:self.period] = np.nan
+        state = {
+            "previous": float(closes[-1]) if len(closes) else None,
+            "gain": {"value": float(gain[-1]) if len(gain) else 0.0, "count": len(deltas)},
+            "loss": {"value": float(loss[-1]) if len(loss) else 0.0, "count": len(deltas)},
+        }
+        return rsi[:, np.newaxis], state
+
+    def step(self, state, close):
+        previous, state["previous"] = state["previous"], close
+        if previous is None:
+            return [math.nan]
+        delta = close - previous
+        gain = _ema_step(state["gain"], max(delta, 0.0), self.alpha)
+        loss = _ema_step(state["loss"], max(-delta, 0.0), self.alpha)
+        if state["gain"]["count"] < self.period:
+            return [math.nan]
+        return [float(self._rsi(np.float64(gain), np.float64(loss)))]
+
+
+class MACD:
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow, self.signal = int(fast), int(slow), int(signal)
+        suffix = "" if (self.fast, self.slow, self.signal) == (12, 26, 9) else f"_{self.fast}_{self.slow}_{self.signal}"
+        self.columns = [f"MACD{suffix}", f"MACD_signal{suffix}", f"MACD_hist{suffix}"]
+
+    def backfill(self, closes):
+        fast = _ewm(closes, 2 / (self.fast + 1))
+        slow = _ewm(closes, 2 / (self.slow + 1))
+        line = fast - slow
+        line[:self.slow - 1] = np.nan
+
+        # The signal line starts at the first valid MACD value
+        signal = np.full(len(closes), np.nan)
+        signal_raw = _ewm(line[self.slow - 1:], 2 / (self.signal + 1))
+        signal[self.slow - 1:] = signal_raw
+        signal[:self.slow + self.signal - 2] = np.nan
+
+        state = {
+            "fast": {"value": float(fast[-1]) if len(fast) else 0.0, "count": len(closes)},
+            "slow": {"value": float(slow[-1]) if len(slow) else 0.0, "count": len(closes)},
+            "signal": {"value": float(signal_raw[-1]) if len(signal_raw) else 0.0, "count": len(signal_raw)},
+        }
+        return np.column_stack([line, signal, line - signal]), state
+
+    def step(self, state, close):
+        fast = _ema_step(state["fast"], close, 2 / (self.fast + 1))
+        slow = _ema_step(state["slow"], close, 2 / (self.slow + 1))
+        if state["slow"]["count"] < self.slow:
+            return [math.nan] * 3
+        line = fast - slow
+        signal = _ema_step(state["signal"], line, 2 / (self.signal + 1))
+        if state["signal"]["count"] < self.signal:
+            return [line, math.nan, math.nan]
+        return [line, signal, line - signal]
+
+
+class BollingerBands:
+    """Middle band is the SMA; the bands sit `width` population standard deviations away."""
+
+    def __init__(self, period=20, width=2.0):
+        self.period = int(period)
+        self.width = float(width)
+        suffix = f"_{self.period}" if self.width == 2.0 else f"_{self.period}_{self.width:g}"
+        self.columns = [f"BB_upper{suffix}", f"BB_middle{suffix}", f"BB_lower{suffix}"]
+
+    def backfill(self, closes):
+        rolling = pd.Series(closes).rolling(self.period)
+        middle = rolling.mean().to_numpy()
+        std = rolling.std(ddof=0).to_numpy()
+        window = np.asarray(closes[-self.period:], dtype=float)
+        state = {
+            "window": window.tolist(),
+            "mean": float(window.mean()) if len(window) else 0.0,
+            "m2": float(np.sum((window - window.mean()) ** 2)) if len(window) else 0.0,
+        }
+        return np.column_stack([middle + self.width * std, middle, middle - self.width * std]), state
+
+    def step(self, state, close):
+        # Welford's update, extended to drop the close leaving the window
+        window = state["window"]
+        window.append(close)
+        if len(window) > self.period:
+            old = window.pop(0)
+            mean = state["mean"] + (close - old) / self.period
+            state["m2"] += (close - old) * (close - mean + old - state["mean"])
+        else:
+            mean = state["mean"] + (close - state["mean"]) / len(window)
+            state["m2"] += (close - state["mean"]) * (close - mean)
+        state["mean"] = mean
+
+        if len(window) < self.period:
+            return [math.nan] * 3
+        std = math.sqrt(max(state["m2"], 0.0) / self.period)
+        return [mean + self.width * std, mean, mean - self.width * std]
+
+
+INDICATORS = {
+    "sma": SMA,
+    "ema": EMA,
+    "rsi": RSI,
+    "macd": MACD,
+    "bbands": BollingerBands,
+}
+
+
+def parse_spec(spec):
+    """
+    Build the indicator named by `spec`, e.g. "rsi_14" or "bbands_20_2".
+
+    Raises:
+        ValueError: If the name or its parameters are invalid
+    """
+    name, *params = spec.lower().split("_")
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator '{spec}'. Choose from {sorted(INDICATORS)}")
+    try:
+        indicator = INDICATORS[name](*[float(p) for p in params])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid parameters for indicator '{spec}'")
+    if min(getattr(indicator, attr) for attr in ("period", "fast", "slow", "signal") if hasattr(indicator, attr)) < 1:
+        raise ValueError(f"Indicator periods must be positive in '{spec}'")
+    return indicator
+
+
+class _Series:
+    """One indicator's outputs for a stored series plus the state needed to extend it."""
+
+    def __init__(self, times, closes, outputs, settled_state):
+        self.outputs = outputs
+        # The last bar may still be revised upstream, so state is kept as of the bar before it
+        self.settled_time = times[-2] if len(times) >= 2 else None
+        self.settled_close = closes[-2] if len(closes) >= 2 else None
+        self.settled_state = settled_state
+
+
+class IndicatorEngine:
+    """
+    Indicator values per (symbol, interval, indicator), kept in step with the bar store.
+
+    Args:
+        max_series: Most series kept in memory; the least recently used are dropped
+    """
+
+    def __init__(self, max_series=1024):
+        self.max_series = max_series
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def compute(self, symbol, interval, bars, specs):
+        """
+        Indicator columns aligned with `bars`.
+
+        Args:
+            symbol: Series symbol
+            interval: Series interval
+            bars: Stored bars (see store.BAR_DTYPE), oldest first
+            specs: Indicator specs, e.g. ["sma_20", "rsi_14"]
+
+        Returns:
+            Dict of column name -> float array of len(bars), NaN during warm-up
+
+        Raises:
+            ValueError: If a spec is invalid
+        """
+        indicators = [(spec.lower(), parse_spec(spec)) for spec in specs]
+        times = np.asarray(bars["datetime"])
+        closes = np.asarray(bars["close"], dtype=np.float64)
+
+        columns = {}
+        for spec, indicator in indicators:
+            key = (symbol.upper(), interval, spec)
+            with self._lock:
+                key_lock = self._key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                series = self._sync(key, indicator, times, closes)
+            for i, column in enumerate(indicator.columns):
+                columns[column] = series.outputs[:, i]
+        return columns
+
+    def _sync(self, key, indicator, times, closes):
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+
+        updated = self._extend(series, indicator, times, closes) if series is not None else None
+        if updated is None:
+            updated = self._backfill(indicator, times, closes)
+
+        with self._lock:
+            self._series[key] = updated
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_series:
+                evicted, _ = self._series.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+        return updated
+
+    @staticmethod
+    def _backfill(indicator, times, closes):
+        outputs, state = indicator.backfill(closes[:-1])
+        outputs = outputs.reshape(-1, len(indicator.columns))
+        settled_state = copy.deepcopy(state)
+        if len(closes):
+            outputs = np.vstack([outputs, [indicator.step(state, float(closes[-1]))]])
+        return _Series(times, closes, outputs, settled_state)
+
+    @staticmethod
+    def _extend(series, indicator, times, closes):
+        """Step only the revised and new bars; None when a full backfill is needed."""
+        if series.settled_time is None:
+            return None
+        position = int(np.searchsorted(times, series.settled_time))
+        if position >= len(times) - 1 or times[position] != series.settled_time or closes[position] != series.settled_close:
+            # History was rewritten, or the series no longer reaches past the settled bar
+            return None
+        settled = len(series.outputs) - 2
+        first_kept = settled - position
+        if first_kept < 0 or len(times) - position - 1 > MAX_INCREMENTAL_BARS:
+            return None
+
+        state = copy.deepcopy(series.settled_state)
+        settled_state = state
+        rows = []
+        for index in range(position + 1, len(times)):
+            if index == len(times) - 1:
+                settled_state = copy.deepcopy(state)
+            rows.append(indicator.step(state, float(closes[index])))
+
+        outputs = np.vstack([series.outputs[first_kept:settled + 1], rows])
+        return _Series(times, closes, outputs, settled_state)
@@ -0,0 +1,322 @@
+"""
+Inference backends for the LSTM price forecaster.
+
+Every backend exposes `predict(windows)` taking a float array shaped
+(N, sequence_length, 1) and returning predictions shaped (N, 1), the same
+contract as Keras `model.predict`, so `multi_step_forecast` can use any of them.
+
+Backends:
+    numpy  - pure NumPy forward pass over weights read from the pickled model
+    keras  - the pickled Keras model itself
+    tflite - a TFLite flatbuffer exported from the pickled model
+    onnx   - an ONNX graph exported from the pickled model
+
+Usage:
+    python inference.py export stock_price_prediction.pkl --format npz
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import joblib
+import numpy as np
+
+# Backend used when INFERENCE_BACKEND is not set
+DEFAULT_BACKEND = "numpy"
+
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+}
+
+
+def extract_layers(keras_model):
+    """
+    Read the inference-relevant layers out of a Keras Sequential model.
+
+    Returns:
+        List of (spec, weights) pairs where spec is a JSON-serialisable dict
+        describing the layer and weights is a list of float32 arrays.
+    """
+    layers = []
+    for layer in keras_model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+        weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+
+        if kind == "Dropout":
+            # Dropout is the identity at inference time
+            continue
+        if kind == "LSTM":
+            if config.get("activation") != "tanh" or config.get("recurrent_activation") != "sigmoid":
+                raise ValueError(f"Unsupported LSTM activations in layer {layer.name}")
+            spec = {"kind": "lstm", "units": config["units"], "return_sequences": config["return_sequences"]}
+        elif kind == "Dense":
+            if config.get("activation") not in _ACTIVATIONS:
+                raise ValueError(f"Unsupported Dense activation in layer {layer.name}: {config.get('activation')}")
+            spec = {"kind": "dense", "activation": config["activation"]}
+        else:
+            raise ValueError(f"Unsupported layer type for NumPy inference: {kind}")
+
+        layers.append((spec, weights))
+    return layers
+
+
+def fingerprint(path):
+    """SHA-1 of a model file, used to tell whether exported weights are stale."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def save_layers(layers, path, source_fingerprint=""):
+    """Write extracted layers to an .npz file that loads without TensorFlow."""
+    arrays = {
+        "spec": np.array(json.dumps([spec for spec, _ in layers])),
+        "source": np.array(source_fingerprint),
+    }
+    for i, (_, weights) in enumerate(layers):
+        for j, w in enumerate(weights):
+            arrays[f"layer{i}_{j}"] = w
+
+    # Unique per writer: a worker re-exporting stale weights may race finetune.py or another worker
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def stored_fingerprint(path):
+    """Fingerprint of the model an .npz was exported from, or None if unreadable."""
+    try:
+        with np.load(path) as data:
+            return str(data["source"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_layers(path):
+    """Read layers written by `save_layers`."""
+    with np.load(path) as data:
+        specs = json.loads(str(data["spec"]))
+        layers = []
+        for i, spec in enumerate(specs):
+            count = 3 if spec["kind"] == "lstm" else 2
+            layers.append((spec, [data[f"layer{i}_{j}"] for j in range(count)]))
+    return layers
+
+
+def _sibling(model_path, extension):
+    return os.path.splitext(model_path)[0] + extension
+
+
+def _is_fresh(derived_path, model_path):
+    """True if `derived_path` exists and is not older than the model it was built from."""
+    return (
+        os.path.exists(derived_path)
+        and (not os.path.exists(model_path) or os.path.getmtime(derived_path) >= os.path.getmtime(model_path))
+    )
+
+
+class NumpyLSTMBackend:
+    """Pure NumPy forward pass of a stacked LSTM + Dense network."""
+
+    name = "numpy"
+
+    def __init__(self, layers):
+        self.layers = layers
+
+    @classmethod
+    def from_file(cls, model_path):
+        """
+        Load weights for `model_path`, preferring the exported .npz next to it.
+
+        The .npz records the SHA-1 of the pickle it came from and is rebuilt when
+        missing or stale; only that step needs TensorFlow.
+        """
+        npz_path = _sibling(model_path, ".npz")
+        if os.path.exists(model_path):
+            source = fingerprint(model_path)
+            if stored_fingerprint(npz_path) != source:
+                logging.info(f"Exporting NumPy weights from {model_path} to {npz_path}")
+                save_layers(extract_layers(joblib.load(model_path)), npz_path, source)
+        return cls(load_layers(npz_path))
+
+    @staticmethod
+    def _lstm(inputs, kernel, recurrent_kernel, bias, return_sequences):
+        batch_size, steps, _ = inputs.shape
+        units = recurrent_kernel.shape[0]
+
+        # Input projections for every timestep in one matmul; only h @ U stays in the loop
+        projected = inputs @ kernel + bias
+        h = np.zeros((batch_size, units), dtype=np.float32)
+        c = np.zeros((batch_size, units), dtype=np.float32)
+        outputs = np.empty((batch_size, steps, units), dtype=np.float32) if return_sequences else None
+
+        for t in range(steps):
+            z = projected[:, t] + h @ recurrent_kernel
+            # Keras gate order: input, forget, cell, output
+            i = _sigmoid(z[:, :units])
+            f = _sigmoid(z[:, units:2 * units])
+            g = np.tanh(z[:, 2 * units:3 * units])
+            o = _sigmoid(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * np.tanh(c)
+            if return_sequences:
+                outputs[:, t] = h
+
+        return outputs if return_sequences else h
+
+    def predict(self, windows):
+        x = np.asarray(windows, dtype=np.float32)
+        for spec, weights in self.layers:
+            if spec["kind"] == "lstm":
+                x = self._lstm(x, *weights, spec["return_sequences"])
+            else:
+                kernel, bias = weights
+                x = _ACTIVATIONS[spec["activation"]](x @ kernel + bias)
+        return x
+
+
+class KerasBackend:
+    """Run the pickled Keras model directly."""
+
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def from_file(cls, model_path):
+        return cls(joblib.load(model_path))
+
+    def predict(self, windows):
+        return self.model.predict(np.asarray(windows, dtype=np.float32), verbose=0)
+
+
+class TFLiteBackend:
+    """Run an exported TFLite flatbuffer with the standalone interpreter when available."""
+
+    name = "tflite"
+
+    def __init__(self, tflite_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=tflite_path)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+
+    @classmethod
+    def from_file(cls, model_path):
+        tflite_path = _sibling(model_path, ".tflite")
+        if not _is_fresh(tflite_path, model_path):
+            export_tflite(model_path, tflite_path)
+        return cls(tflite_path)
+
+    def predict(self, windows):
+        x = np.asarray(windows, dtype=np.float32)
+        # The fused LSTM graph is exported with batch size 1; invoking it is cheap
+        # enough that batches run window by window
+        outputs = []
+        for window in x:
+            self.interpreter.set_tensor(self.input_index, window[np.newaxis])
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index)[0])
+        return np.array(outputs)
+
+
+class OnnxBackend:
+    """Run an exported ONNX graph on the onnxruntime CPU provider."""
+
+    name = "onnx"
+
+    def __init__(self, onnx_path):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @classmethod
+    def from_file(cls, model_path):
+        onnx_path = _sibling(model_path, ".onnx")
+        if not _is_fresh(onnx_path, model_path):
+            export_onnx(model_path, onnx_path)
+        return cls(onnx_path)
+
+    def predict(self, windows):
+        x = np.asarray(windows, dtype=np.float32)
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+BACKENDS = {
+    "numpy": NumpyLSTMBackend,
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def load_backend(model_path, backend=None):
+    """
+    Load `model_path` with the requested backend.
+
+    Args:
+        model_path: Path to the pickled Keras model
+        backend: Backend name; defaults to the INFERENCE_BACKEND env var, then "numpy"
+    """
+    backend = backend or os.getenv("INFERENCE_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose one of {sorted(BACKENDS)}")
+    return BACKENDS[backend].from_file(model_path)
+
+
+def export_tflite(model_path, tflite_path):
+    """Convert the pickled Keras model to a TFLite flatbuffer."""
+    import keras
+    import tensorflow as tf
+
+    model = joblib.load(model_path)
+    # A fixed batch size of 1 lets the converter fuse the LSTM layers into builtin ops
+    inputs = keras.Input(shape=model.input_shape[1:], batch_size=1)
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras.Model(inputs, model(inputs)))
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model_path, onnx_path):
+    """Convert the pickled Keras model to ONNX with a dynamic batch dimension."""
+    import tensorflow as tf
+    import tf2onnx
+
+    model = joblib.load(model_path)
+    signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=signature, output_path=onnx_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the pickled LSTM for lightweight inference backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write backend artifacts next to the model")
+    export_parser.add_argument("model_path")
+    export_parser.add_argument("--format", choices=["npz", "tflite", "onnx"], default="npz")
+    args = parser.parse_args()
+
+    if args.format == "npz":
+        layers = extract_layers(joblib.load(args.model_path))
+        save_layers(layers, _sibling(args.model_path, ".npz"), fingerprint(args.model_path))
+    elif args.format == "tflite":
+        export_tflite(args.model_path, _sibling(args.model_path, ".tflite"))
+    else:
+        export_onnx(args.model_path, _sibling(args.model_path, ".onnx"))
+    print(f"Exported {args.model_path} as {args.format}")
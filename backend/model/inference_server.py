@@ -0,0 +1,343 @@
+"""
+Micro-batching model server shared by the API workers.
+
+`MicroBatcher` wraps an inference backend (see inference.py) and turns
+concurrent `predict` calls into one batched call: each `multi_step_forecast`
+step from every in-flight request that arrives within a few milliseconds is
+stacked into a single (N, sequence_length, 1) array and run together.
+
+Run as a process, it holds the only copy of the model and serves the API
+workers over a local socket; the workers use `RemoteBackend`, which has the
+same `predict(windows)` contract as the in-process backends. Any worker can
+ask the server to reload the model file, e.g. after finetune.py replaced it;
+every worker then sees the server's model version change and drops the
+forecasts it cached from the old weights.
+
+Messages are pickled, so the server and the workers must share a secret
+INFERENCE_SERVER_AUTHKEY; neither side starts without one.
+
+Usage:
+    export INFERENCE_SERVER_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(32))')
+    python inference_server.py --model stock_price_prediction.pkl --address 127.0.0.1:8765
+    INFERENCE_SERVER=127.0.0.1:8765 uvicorn app:app --workers 4
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+def resolve_authkey(authkey=None):
+    """The shared secret for the server socket; there is no default, since whoever knows it can run code."""
+    authkey = authkey or os.getenv("INFERENCE_SERVER_AUTHKEY")
+    if not authkey:
+        raise ValueError("INFERENCE_SERVER_AUTHKEY must be set to use the inference server")
+    return authkey.encode()
+
+
+def parse_address(address):
+    """"host:port" -> (host, port); anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class _Pending:
+    def __init__(self, windows):
+        self.windows = windows
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Batch concurrent `predict` calls on one backend.
+
+    A single thread owns the backend. It takes the first queued call, then
+    keeps collecting for up to `max_wait` seconds while fewer callers have
+    joined than were in the previous batch, so steady concurrent traffic
+    forms full batches without a lone request waiting on every step.
+
+    Args:
+        backend: Inference backend with `predict(windows)`
+        max_batch: Most windows run in one backend call
+        max_wait: Seconds to wait for more callers to join a batch
+    """
+
+    def __init__(self, backend, max_batch=256, max_wait=0.002):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._expected = 1
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def predict(self, windows):
+        """Queue `windows` (N, sequence_length, 1) for the next batch and wait for its (N, 1) predictions."""
+        pending = _Pending(np.asarray(windows, dtype=np.float32))
+        # Queue and (re)start under one lock so a thread exiting after `close` cannot strand the call
+        with self._start_lock:
+            self._queue.put(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+                self._thread.start()
+                if self._closed:
+                    # A closed batcher answers this straggler and stops again
+                    self._queue.put(None)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def close(self):
+        """
+        Let the batching thread exit once the calls already queued are answered.
+
+        Used when a new model is swapped in: requests still holding this
+        batcher finish their rollouts on the old model, and a later call
+        restarts the thread just for itself.
+        """
+        with self._start_lock:
+            self._closed = True
+            self._queue.put(None)
+
+    def _next(self):
+        """The next queued call, or None once closed with nothing left to run."""
+        while True:
+            pending = self._queue.get()
+            if pending is not None:
+                return pending
+            with self._start_lock:
+                if self._queue.empty():
+                    self._thread = None
+                    return None
+                # Calls queued behind the close are answered first
+                self._queue.put(None)
+
+    def _collect(self):
+        first = self._next()
+        if first is None:
+            return None
+        batch = [first]
+        rows = len(batch[0].windows)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch:
+            try:
+                # Whatever queued up while the last batch ran joins without waiting
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self._expected or remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if pending is None:
+                # Closed mid-batch: run what was collected and stop after it
+                self._queue.put(None)
+                break
+            batch.append(pending)
+            rows += len(pending.windows)
+        self._expected = len(batch)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                inputs = np.concatenate([pending.windows for pending in batch])
+                outputs = np.asarray(self.backend.predict(inputs))
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+
+            offset = 0
+            for pending in batch:
+                pending.result = outputs[offset:offset + len(pending.windows)]
+                offset += len(pending.windows)
+                pending.done.set()
+
+
+class RemoteBackend:
+    """
+    Client for an inference server; `predict` matches the local backends.
+
+    Each concurrent caller borrows its own connection from a small pool, so
+    steps from different requests reach the server together and are batched.
+    """
+
+    def __init__(self, address, authkey=None, connect_timeout=30.0):
+        self.address = parse_address(address)
+        self.authkey = resolve_authkey(authkey)
+        self.connect_timeout = connect_timeout
+        self._idle = queue.LifoQueue()
+        self._closed = False
+
+    def _connect(self):
+        # The server may still be loading the model when the API workers start
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _request(self, message):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+
+        try:
+            connection.send(message)
+            ok, payload = connection.recv()
+        except (EOFError, OSError):
+            # Drop the broken connection; the next call opens a fresh one
+            connection.close()
+            raise
+        if self._closed:
+            connection.close()
+        else:
+            self._idle.put(connection)
+
+        if not ok:
+            raise RuntimeError(f"Inference server error: {payload}")
+        return payload
+
+    def predict(self, windows):
+        return self._request(np.asarray(windows, dtype=np.float32))
+
+    def reload(self):
+        """Have the server load its model file again; returns the server's new version."""
+        return self._request(("reload",))
+
+    def version(self):
+        """(epoch, generation) of the server's model; a reload or a server restart changes it."""
+        return self._request(("version",))
+
+    def close(self):
+        """Close the pooled connections; calls still running close theirs when they finish."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ModelServer:
+    """
+    The server's model behind a MicroBatcher, replaceable while serving.
+
+    `version` is (epoch, generation): the epoch is fixed per server process
+    and the generation counts reloads, so a client can tell its cached
+    forecasts are stale after either.
+    """
+
+    def __init__(self, model_path, backend=None, max_batch=256, max_wait=0.002):
+        self.model_path = model_path
+        self.backend = backend
+        self.batching = {"max_batch": max_batch, "max_wait": max_wait}
+        self.epoch = time.time()
+        self.generation = 0
+        self._reload_lock = threading.Lock()
+        self.batcher = self._load()
+
+    def _load(self):
+        from inference import load_backend
+        return MicroBatcher(load_backend(self.model_path, self.backend), **self.batching)
+
+    @property
+    def version(self):
+        return self.epoch, self.generation
+
+    def predict(self, windows):
+        return self.batcher.predict(windows)
+
+    def reload(self):
+        """
+        Serve the model file as it is on disk now.
+
+        Calls already queued on the old batcher finish on the old model, as
+        with an in-process swap (see MicroBatcher.close).
+        """
+        with self._reload_lock:
+            batcher = self._load()
+            old, self.batcher = self.batcher, batcher
+            self.generation += 1
+            old.close()
+            logging.info(f"Reloaded {self.model_path} (generation {self.generation})")
+            return self.version
+
+    def handle(self, message):
+        """Answer one client message: windows to predict, or a ("reload",) or ("version",) command."""
+        if isinstance(message, tuple):
+            if message[0] == "reload":
+                return self.reload()
+            if message[0] == "version":
+                return self.version
+            raise ValueError(f"Unknown command {message[0]!r}")
+        return self.predict(message)
+
+
+def _serve_connection(connection, server):
+    with connection:
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                return
+            try:
+                reply = (True, server.handle(message))
+            except Exception as e:
+                reply = (False, str(e))
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+
+def serve(address, model_path, backend=None, authkey=None, max_batch=256, max_wait=0.002):
+    """Load `model_path` once and answer `predict` calls from any number of API workers."""
+    authkey = resolve_authkey(authkey)
+    server = ModelServer(model_path, backend, max_batch=max_batch, max_wait=max_wait)
+
+    # Listener's default backlog of 1 stalls bursts of workers connecting at once
+    with Listener(parse_address(address), backlog=128, authkey=authkey) as listener:
+        logging.info(f"Inference server for {model_path} listening on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # A client that fails the handshake must not take the server down
+                logging.warning(f"Rejected inference client: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(connection, server), daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the LSTM to API workers with micro-batching")
+    parser.add_argument("--model", default="stock_price_prediction.pkl")
+    parser.add_argument("--address", default=os.getenv("INFERENCE_SERVER", "127.0.0.1:8765"))
+    parser.add_argument("--backend", default=None, help="Inference backend; defaults to INFERENCE_BACKEND")
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("INFERENCE_MAX_BATCH", "256")))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("INFERENCE_MAX_WAIT_MS", "2")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    serve(args.address, args.model, args.backend, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
@@ -0,0 +1,263 @@
+"""
+Bulk ingestion of per-ticker historical CSVs into one columnar dataset.
+
+Kaggle-style CSVs (Date, Open, High, Low, Close, Volume), named like
+MSFT_2006-01-01_to_2018-01-01.csv, are parsed in
+chunks by parallel worker processes and written as uncompressed Arrow IPC
+files, one partition per symbol:
+
+    history/
+        _manifest.json
+        symbol=MSFT/part-0.arrow
+        symbol=AAPL/part-0.arrow
+
+Prices are stored as float32, volumes as int32 (int64 for a ticker whose
+volumes do not fit), dates as date32, and the partition key reads back as a
+categorical (dictionary) symbol column. Each worker holds at most one chunk
+of one file at a time, so peak memory depends on `--chunk-rows` and
+`--workers`, not on the number of files. Uncompressed IPC files can be
+memory-mapped, so `load_symbol` returns arrays backed by the file pages.
+
+Usage:
+    python ingest.py data/*_2006-01-01_to_2018-01-01.csv --out history --workers 8
+    python train.py MSFT AAPL --dataset history
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+MANIFEST = "_manifest.json"
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def _schema(volume_type="int32"):
+    import pyarrow as pa
+    return pa.schema(
+        [("date", pa.date32())]
+        + [(column.lower(), pa.float32()) for column in PRICE_COLUMNS]
+        + [("volume", getattr(pa, volume_type)())]
+    )
+
+
+def partition_path(root, symbol):
+    return os.path.join(root, f"symbol={symbol}", "part-0.arrow")
+
+
+def _to_batch(chunk, volume_type):
+    import pyarrow as pa
+    columns = [pa.array(chunk["Date"].to_numpy(dtype="datetime64[D]"), type=pa.date32())]
+    for column in PRICE_COLUMNS:
+        values = chunk[column].to_numpy(dtype=np.float32)
+        columns.append(pa.array(values, mask=np.isnan(values)))
+    volume = chunk["Volume"].to_numpy(dtype=np.float64)
+    missing = np.isnan(volume)
+    columns.append(pa.array(np.where(missing, 0, volume).astype(volume_type), mask=missing))
+    return pa.RecordBatch.from_arrays(columns, schema=_schema(volume_type))
+
+
+def ingest_file(csv_path, out_root, chunk_rows=100_000):
+    """
+    Convert one ticker CSV into its dataset partition.
+
+    The partition is written to a temporary file and renamed into place, so
+    readers never see a partial one and re-ingesting a ticker replaces it.
+
+    Returns:
+        Dict describing the partition for the manifest
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    # Same rule as train.ticker_from_path, without importing the training stack into workers
+    symbol = os.path.basename(csv_path).split("_")[0].upper()
+    path = partition_path(out_root, symbol)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    def read_chunks():
+        return pd.read_csv(
+            csv_path,
+            usecols=["Date", *PRICE_COLUMNS, "Volume"],
+            dtype={column: np.float32 for column in PRICE_COLUMNS} | {"Volume": np.float64},
+            parse_dates=["Date"],
+            chunksize=chunk_rows,
+        )
+
+    # Volumes fit int32 for almost every ticker; one pass over that column settles it
+    max_volume = max((chunk["Volume"].max() for chunk in pd.read_csv(csv_path, usecols=["Volume"], chunksize=chunk_rows)), default=0)
+    volume_type = "int32" if not max_volume > INT32_MAX else "int64"
+
+    rows, ordered, last = 0, True, None
+    first_date = last_date = None
+    with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, _schema(volume_type)) as writer:
+        for chunk in read_chunks():
+            chunk = chunk.dropna(subset=["Date"])
+            if chunk.empty:
+                continue
+            dates = chunk["Date"]
+            ordered = ordered and dates.is_monotonic_increasing and (last is None or dates.iloc[0] > last)
+            last = dates.iloc[-1]
+            first_date = dates.min() if first_date is None else min(first_date, dates.min())
+            last_date = dates.max() if last_date is None else max(last_date, dates.max())
+            writer.write_batch(_to_batch(chunk, volume_type))
+            rows += len(chunk)
+
+    if not ordered:
+        # Rare: rewrite the (single-ticker, so small) partition in date order
+        with pa.memory_map(tmp_path) as source:
+            table = ipc.open_file(source).read_all().sort_by("date")
+        with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    os.replace(tmp_path, path)
+    return {
+        "symbol": symbol,
+        "source": os.path.abspath(csv_path),
+        "rows": rows,
+        "first_date": first_date.strftime("%Y-%m-%d") if first_date is not None else None,
+        "last_date": last_date.strftime("%Y-%m-%d") if last_date is not None else None,
+        "volume_type": volume_type,
+        "bytes": os.path.getsize(path),
+    }
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"partitions": {}}
+
+
+def _write_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def ingest_many(csv_paths, out_root, workers=1, chunk_rows=100_000):
+    """
+    Ingest every CSV in `csv_paths` into `out_root`, `workers` files at a time.
+
+    Partitions of tickers not in `csv_paths` are kept, so a universe can be
+    ingested in several runs.
+
+    Returns:
+        Tuple of (partitions, errors): manifest entries written and a dict of
+        CSV path -> error message
+    """
+    workers = max(1, min(workers, len(csv_paths)))
+    os.makedirs(out_root, exist_ok=True)
+    partitions, errors = [], {}
+
+    # spawn rather than fork, as in train.py, so workers start from a clean interpreter
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = {pool.submit(ingest_file, path, out_root, chunk_rows): path for path in csv_paths}
+        for future in as_completed(futures):
+            try:
+                partitions.append(future.result())
+            except Exception as e:
+                logging.error(f"Ingestion failed for {futures[future]}: {e}")
+                errors[futures[future]] = str(e)
+
+    manifest = read_manifest(out_root)
+    manifest["partitions"].update({p["symbol"]: p for p in partitions})
+    manifest["updated_at"] = time.time()
+    _write_manifest(out_root, manifest)
+    return partitions, errors
+
+
+def open_dataset(root):
+    """
+    The whole dataset as a `pyarrow.dataset.Dataset` with a categorical symbol column.
+
+    Filter on `ds.field("symbol")` to read only some partitions.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitions = read_manifest(root)["partitions"]
+    symbols = sorted(partitions)
+    wide = any(p["volume_type"] == "int64" for p in partitions.values())
+    symbol_type = pa.dictionary(pa.int32(), pa.string())
+    partitioning = ds.HivePartitioning(pa.schema([("symbol", symbol_type)]), dictionaries={"symbol": pa.array(symbols)})
+    schema = _schema("int64" if wide else "int32").append(pa.field("symbol", symbol_type))
+    return ds.dataset([partition_path(root, s) for s in symbols], format="ipc", schema=schema,
+                      partitioning=partitioning, partition_base_dir=root)
+
+
+def load_symbol(root, symbol, columns=None):
+    """
+    One symbol's bars as NumPy arrays memory-mapped from its partition.
+
+    Args:
+        root: Dataset directory
+        symbol: Ticker
+        columns: Fields to return; all of them by default
+
+    Returns:
+        Dict of field -> array: "datetime" (datetime64[D]), float32 prices,
+        integer volume. Prices and volume are views of the mapped file when
+        the partition is a single batch (any file shorter than `chunk_rows`)
+        and has no missing values; otherwise they are copied, with NaN
+        (prices) or 0 (volume) filling the gaps.
+
+    Raises:
+        KeyError: If the symbol is not in the dataset
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    path = partition_path(root, symbol.upper())
+    if not os.path.exists(path):
+        raise KeyError(f"{symbol} is not in the dataset at {root}")
+
+    # The table's buffers point into the mapping, which stays open as long as they are referenced
+    table = ipc.open_file(pa.memory_map(path)).read_all()
+    fields = columns or ["datetime", *(c.lower() for c in PRICE_COLUMNS), "volume"]
+    arrays = {}
+    for field in fields:
+        column = table.column("date" if field == "datetime" else field).combine_chunks()
+        if field == "datetime":
+            # date32 widens to datetime64[D], so this one column is copied
+            arrays[field] = column.to_numpy(zero_copy_only=False).astype("datetime64[D]")
+        elif column.null_count:
+            arrays[field] = column.fill_null(0 if field == "volume" else np.nan).to_numpy()
+        else:
+            arrays[field] = column.to_numpy()
+    return arrays
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest ticker CSVs into a partitioned Arrow dataset")
+    parser.add_argument("csv_paths", nargs="+", help="Kaggle-style ticker CSVs (Date, Open, High, Low, Close, Volume)")
+    parser.add_argument("--out", default="history", help="Dataset directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Files parsed in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="Rows parsed at a time per file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    started = time.perf_counter()
+    partitions, errors = ingest_many(args.csv_paths, args.out, workers=args.workers, chunk_rows=args.chunk_rows)
+    wall = time.perf_counter() - started
+
+    rows = sum(p["rows"] for p in partitions)
+    size = sum(p["bytes"] for p in partitions)
+    print(f"Ingested {len(partitions)} tickers ({rows} rows, {size / 1e6:.1f} MB) into {args.out} in {wall:.2f}s")
+    for path, error in sorted(errors.items()):
+        print(f"  failed: {path} ({error})")
+    return partitions, errors
+
+
+if __name__ == "__main__":
+    main()
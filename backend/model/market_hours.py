@@ -0,0 +1,54 @@
+"""
+US equity market hours, for telling whether stored daily bars can still change.
+
+Bars stop changing between the settled close and the next open, so a series
+refreshed after the close needs no refresh until then. Used by the bar store's
+freshness rule and by the prefetcher.
+"""
+import time
+from datetime import datetime, time as dtime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    NEW_YORK = ZoneInfo("America/New_York")
+except (ImportError, ZoneInfoNotFoundError):
+    # Without time zone data every series just follows its TTL
+    NEW_YORK = None
+
+MARKET_OPEN = dtime(9, 30)
+# Upstream publishes the final daily bar a little after the 16:00 close
+MARKET_SETTLED = dtime(16, 15)
+
+
+def last_close(now=None):
+    """
+    Epoch seconds of the most recent settled US equity close, or None without time zone data.
+
+    Weekends are skipped; exchange holidays are not modelled, so on one the
+    previous session's close is reported once the usual settle time passes.
+    """
+    if NEW_YORK is None:
+        return None
+    local = datetime.fromtimestamp(now if now is not None else time.time(), NEW_YORK)
+    day = local.date()
+    while True:
+        settled = datetime.combine(day, MARKET_SETTLED, NEW_YORK)
+        if day.weekday() < 5 and settled <= local:
+            return settled.timestamp()
+        day -= timedelta(days=1)
+
+
+def market_closed(now=None):
+    """True between a settled close and the next weekday open."""
+    if NEW_YORK is None:
+        return False
+    local = datetime.fromtimestamp(now if now is not None else time.time(), NEW_YORK)
+    if local.weekday() >= 5:
+        return True
+    return not (MARKET_OPEN <= local.time() < MARKET_SETTLED)
+
+
+def settled_since(refreshed_at, now=None):
+    """True if the market is closed and data refreshed at `refreshed_at` already includes the last close."""
+    close = last_close(now)
+    return close is not None and market_closed(now) and refreshed_at >= close
@@ -0,0 +1,190 @@
+"""
+Vectorised performance and risk metrics for a whole portfolio.
+
+Every function takes a (days x symbols) matrix of closes, or returns derived
+from one, and computes each metric for all symbols at once with whole-matrix
+NumPy operations, so the cost grows with the size of the matrix rather than
+with a Python loop per symbol or per value. The conventions follow
+`/comprehensive_analysis`: monthly returns from month-end closes, volatility
+annualised from their standard deviation, and a Sharpe ratio over a fixed
+annual risk-free rate.
+"""
+import numpy as np
+
+TRADING_DAYS = 252
+MONTHS = 12
+
+# Largest (windows x symbols x window length) block built at once by rolling_max_drawdown
+_ROLLING_BLOCK = 4_000_000
+
+
+def sanitize(values, default=0.0):
+    """Replace NaN and +/-inf with `default` in one pass."""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, default)
+
+
+def forward_fill(closes):
+    """Carry each column's last valid close over gaps; leading gaps stay NaN."""
+    closes = np.asarray(closes, dtype=np.float64)
+    valid = ~np.isnan(closes)
+    rows = np.where(valid, np.arange(len(closes))[:, np.newaxis], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = closes[rows, np.arange(closes.shape[1])]
+    # Rows before a column's first valid close still point at row 0
+    filled[np.cumsum(valid, axis=0) == 0] = np.nan
+    return filled
+
+
+def simple_returns(closes):
+    """Period-over-period returns, shaped (days - 1, symbols)."""
+    return closes[1:] / closes[:-1] - 1
+
+
+def month_ends(dates):
+    """Row index of the last trading day in each calendar month of `dates`."""
+    months = np.asarray(dates, dtype="datetime64[M]")
+    return np.append(np.flatnonzero(months[1:] != months[:-1]), len(months) - 1)
+
+
+def monthly_returns(dates, closes):
+    """
+    Returns between consecutive month-end closes.
+
+    Returns:
+        Tuple of (months, returns): the month of each return as datetime64[M]
+        and the (months, symbols) return matrix
+    """
+    ends = month_ends(dates)
+    months = np.asarray(dates, dtype="datetime64[M]")[ends]
+    return months[1:], simple_returns(closes[ends])
+
+
+def _nan_std(values, axis=0):
+    counts = np.sum(~np.isnan(values), axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(values, axis=axis) / counts
+        squares = np.nansum((values - np.expand_dims(mean, axis)) ** 2, axis=axis)
+        std = np.sqrt(squares / (counts - 1))
+    std[counts < 2] = np.nan
+    return mean, std
+
+
+def annualised_volatility(returns, periods_per_year=MONTHS):
+    """Sample standard deviation of each column scaled to a year, NaN-aware."""
+    _, std = _nan_std(returns)
+    return std * np.sqrt(periods_per_year)
+
+
+def sharpe_ratio(returns, risk_free_rate=0.02, periods_per_year=MONTHS):
+    """Annualised Sharpe ratio of each column against an annual risk-free rate."""
+    mean, std = _nan_std(returns - risk_free_rate / periods_per_year)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return mean / std * np.sqrt(periods_per_year)
+
+
+def max_drawdown(closes):
+    """Largest peak-to-trough fall of each column, as a positive fraction."""
+    peaks = np.fmax.accumulate(closes, axis=0)
+    with np.errstate(invalid="ignore"):
+        return np.nanmax(1 - closes / peaks, axis=0, initial=0.0)
+
+
+def _window_sums(values, window):
+    """Sums and valid counts over every trailing `window` rows, NaNs skipped."""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    squares = np.cumsum(np.where(valid, values, 0.0) ** 2, axis=0)
+
+    def trailing(cumulative):
+        out = cumulative[window - 1:].copy()
+        out[1:] -= cumulative[:-window]
+        return out
+
+    return trailing(sums), trailing(squares), trailing(counts)
+
+
+def rolling_return(closes, window):
+    """Return over each trailing `window` of rows, shaped (days - window + 1, symbols)."""
+    return closes[window - 1:] / closes[:len(closes) - window + 1] - 1
+
+
+def rolling_volatility_sharpe(returns, window, risk_free_rate=0.02, periods_per_year=TRADING_DAYS):
+    """
+    Annualised volatility and Sharpe ratio over each trailing `window` of returns.
+
+    Uses running sums, so every window of every symbol costs O(1).
+
+    Returns:
+        Tuple of (volatility, sharpe), each shaped (len(returns) - window + 1, symbols)
+    """
+    sums, squares, counts = _window_sums(returns, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        variance = np.maximum(squares - sums * mean, 0.0) / (counts - 1)
+        std = np.sqrt(variance)
+        volatility = std * np.sqrt(periods_per_year)
+        sharpe = (mean - risk_free_rate / periods_per_year) / std * np.sqrt(periods_per_year)
+    volatility[counts < 2] = np.nan
+    sharpe[counts < 2] = np.nan
+    return volatility, sharpe
+
+
+def rolling_max_drawdown(closes, window):
+    """Max drawdown within each trailing `window` of closes, shaped (days - window + 1, symbols)."""
+    windows = np.lib.stride_tricks.sliding_window_view(closes, window, axis=0)
+    out = np.empty(windows.shape[:2])
+    # Bound the temporary (windows, symbols, window) block for long histories
+    step = max(1, _ROLLING_BLOCK // max(1, closes.shape[1] * window))
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        peaks = np.fmax.accumulate(block, axis=-1)
+        with np.errstate(invalid="ignore"):
+            out[start:start + step] = np.nanmax(1 - block / peaks, axis=-1, initial=0.0)
+    return out
+
+
+def analyse(dates, closes, windows=(21, 63), risk_free_rate=0.02):
+    """
+    Full-period and rolling metrics for every column of `closes`.
+
+    Args:
+        dates: Trading days, ascending, one per row of `closes`
+        closes: (days x symbols) closes; NaN where a symbol has no price
+        windows: Rolling window lengths in trading days
+        risk_free_rate: Annual risk-free rate for the Sharpe ratios
+
+    Returns:
+        Dict of NumPy arrays: full-period metrics per symbol (percentages as in
+        `/comprehensive_analysis`), monthly returns, and per-window rolling
+        metrics with the dates they end on. Undefined values are NaN.
+    """
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    closes = forward_fill(closes)
+    daily = simple_returns(closes)
+    months, monthly = monthly_returns(dates, closes)
+
+    first = closes[np.argmax(~np.isnan(closes), axis=0), np.arange(closes.shape[1])]
+    results = {
+        "total_return": (closes[-1] / first - 1) * 100,
+        "volatility": annualised_volatility(monthly) * 100,
+        "sharpe_ratio": sharpe_ratio(monthly, risk_free_rate),
+        "max_drawdown": max_drawdown(closes) * 100,
+        "months": months,
+        "monthly_returns": monthly * 100,
+        "rolling": {},
+    }
+
+    for window in windows:
+        if window < 2 or window >= len(closes):
+            continue
+        volatility, sharpe = rolling_volatility_sharpe(daily, window - 1, risk_free_rate)
+        results["rolling"][window] = {
+            "dates": dates[window - 1:],
+            "return": rolling_return(closes, window) * 100,
+            "volatility": volatility * 100,
+            "sharpe_ratio": sharpe,
+            "max_drawdown": rolling_max_drawdown(closes, window) * 100,
+        }
+    return results
@@ -0,0 +1,136 @@
+"""
+Background prefetch for the symbols most requested right now.
+
+`DemandTracker` scores each request target (a symbol's bars, a seeded
+forecast, an analysis date range) by its request count with exponential
+decay, so the ranking follows current traffic. `Prefetcher` wakes up
+periodically and, while no request is in flight, walks the hottest targets
+and runs a warmer for each. Warmers refresh bars, extend cached forecast
+rollouts and fetch fundamentals. They decide for themselves whether a target
+needs work and whether spare upstream credits allow it, so a later request
+for that target is a cache hit.
+
+US equities stop changing between the close and the next open. Bars
+refreshed after the close therefore stay fresh until then (see
+market_hours.py and store.BarStore.is_fresh), and one pass after the close
+settles every hot symbol for the night.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+
+# Re-exported for callers that imported them from here before they moved
+from market_hours import last_close, market_closed, settled_since  # noqa: F401
+
+
+class DemandTracker:
+    """
+    Exponentially decayed request counts per target.
+
+    A target is a hashable tuple whose first item names its kind, e.g.
+    ("bars", "AAPL", "1day"). Only used from the event loop, so unlocked.
+
+    Args:
+        half_life: Seconds after which a request counts half as much
+        max_targets: Targets kept; the coldest are dropped beyond it
+    """
+
+    def __init__(self, half_life=3600.0, max_targets=5000):
+        self.half_life = half_life
+        self.max_targets = max_targets
+        self._scores = {}
+
+    def _decayed(self, score, updated, now):
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def hit(self, target, now=None):
+        now = now if now is not None else time.time()
+        score, updated = self._scores.get(target, (0.0, now))
+        self._scores[target] = (self._decayed(score, updated, now) + 1.0, now)
+        # Prune in bulk so the sort runs once per max_targets / 4 new targets
+        if len(self._scores) > self.max_targets * 1.25:
+            for target, _ in self.hottest(None, now)[self.max_targets:]:
+                del self._scores[target]
+
+    def hottest(self, n, now=None):
+        """The `n` highest-scoring targets (all of them for None) as (target, score), hottest first."""
+        now = now if now is not None else time.time()
+        ranked = sorted(
+            ((target, self._decayed(score, updated, now)) for target, (score, updated) in self._scores.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return ranked if n is None else ranked[:n]
+
+
+class Prefetcher:
+    """
+    Periodically warms the hottest targets while the app is idle.
+
+    Args:
+        tracker: DemandTracker ranking the targets
+        warmers: Target kind -> coroutine function called with the target's
+            remaining items; returns True if it did any work
+        interval: Seconds between passes
+        top_n: Targets considered per pass
+        is_busy: Called before each target; a pass stops as soon as it returns True
+    """
+
+    def __init__(self, tracker, warmers, interval=30.0, top_n=200, is_busy=lambda: False):
+        self.tracker = tracker
+        self.warmers = warmers
+        self.interval = interval
+        self.top_n = top_n
+        self.is_busy = is_busy
+        self.stats = Counter()
+        self.last_pass = None
+        self._task = None
+
+    async def run_once(self):
+        """One pass over the hottest targets; returns the number warmed."""
+        warmed = 0
+        for target, _ in self.tracker.hottest(self.top_n):
+            if self.is_busy():
+                self.stats["interrupted"] += 1
+                break
+            kind, *args = target
+            warmer = self.warmers.get(kind)
+            if warmer is None:
+                continue
+            try:
+                if await warmer(*args):
+                    warmed += 1
+                    self.stats[kind] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.warning(f"Prefetch of {target} failed: {e}")
+        self.last_pass = time.time()
+        return warmed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.is_busy():
+                continue
+            try:
+                warmed = await self.run_once()
+            except Exception as e:
+                logging.error(f"Prefetch pass failed: {e}", exc_info=True)
+                continue
+            if warmed:
+                logging.info(f"Prefetched {warmed} targets")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
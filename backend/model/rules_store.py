@@ -0,0 +1,211 @@
+"""
+On-disk store of mined association rule sets.
+
+Each mining run is keyed by its tickers and date range plus the thresholds it
+was mined with. Its rules are kept column by column in a `.npz` file: the
+metrics as float arrays, and antecedents and consequents as offsets into
+flat arrays of ticker indices. A JSON sidecar describes the run. Both are
+written to temporary files and renamed into place, sidecar last, so
+concurrent writers never clobber each other and readers only see complete
+runs.
+
+Rules mined with thresholds (s, l) contain every rule a stricter (s', l')
+request needs: rule support is the support of its whole itemset, and lift
+is per rule. So stricter requests are answered by filtering a stored run.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["support", "confidence", "lift", "antecedent support", "consequent support", "leverage", "conviction"]
+
+
+def _column_file_name(metric):
+    return metric.replace(" ", "_")
+
+
+def run_key(tickers, start_date, end_date):
+    """Digest identifying a (tickers, date range); ticker order and case do not matter."""
+    canonical = json.dumps([sorted({t.upper() for t in tickers}), start_date, end_date])
+    return hashlib.sha1(canonical.encode()).hexdigest()[:20]
+
+
+def _encode_itemsets(itemsets, index):
+    """frozensets of names -> (offsets, flat item indices), each itemset sorted by name."""
+    lengths = np.fromiter((len(s) for s in itemsets), dtype=np.int32, count=len(itemsets))
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    flat = np.fromiter((index[name] for s in itemsets for name in sorted(s)), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, flat
+
+
+class StoredRules:
+    """One stored rule set, with vectorised filtering and top-k selection."""
+
+    def __init__(self, meta, columns):
+        self.meta = meta
+        self.items = columns["items"]
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["support"])
+
+    def _itemset(self, side, i):
+        offsets = self.columns[f"{side}_offsets"]
+        return [str(self.items[j]) for j in self.columns[f"{side}_items"][offsets[i]:offsets[i + 1]]]
+
+    def _contains(self, side, ticker):
+        """Mask of rules whose `side` itemset includes `ticker`."""
+        matches = np.flatnonzero(self.items == ticker.upper())
+        mask = np.zeros(len(self), dtype=bool)
+        if len(matches):
+            offsets, flat = self.columns[f"{side}_offsets"], self.columns[f"{side}_items"]
+            hits = np.flatnonzero(flat == matches[0])
+            # Map each hit position back to its rule
+            mask[np.searchsorted(offsets, hits, side="right") - 1] = True
+        return mask
+
+    def select(self, min_support=0.0, min_lift=0.0, min_confidence=0.0, antecedent=None, consequent=None):
+        """Indices of the rules passing every filter, in stored order."""
+        mask = (
+            (self.columns["support"] >= min_support)
+            & (self.columns["lift"] >= min_lift)
+            & (self.columns["confidence"] >= min_confidence)
+        )
+        if antecedent:
+            mask &= self._contains("antecedent", antecedent)
+        if consequent:
+            mask &= self._contains("consequent", consequent)
+        return np.flatnonzero(mask)
+
+    def top(self, indices, sort_by="lift", k=None):
+        """The `k` of `indices` with the highest `sort_by`, best first."""
+        values = self.columns[sort_by][indices]
+        if k is not None and k < len(indices):
+            # Partition first so only the kept rules are fully sorted
+            part = np.argpartition(-values, k - 1)[:k]
+            return indices[part[np.argsort(-values[part], kind="stable")]]
+        return indices[np.argsort(-values, kind="stable")]
+
+    def records(self, indices):
+        """JSON-ready rows, in the layout `/stock_association` has always returned."""
+        support, confidence, lift = (self.columns[m] for m in ("support", "confidence", "lift"))
+        return [
+            {
+                "antecedents": self._itemset("antecedent", i),
+                "consequents": self._itemset("consequent", i),
+                "support": round(float(support[i]), 4),
+                "confidence": round(float(confidence[i]), 4),
+                "lift": round(float(lift[i]), 4)
+            }
+            for i in indices
+        ]
+
+
+class RulesStore:
+    """
+    Rule sets under `root`, one directory per (tickers, date range).
+
+    Args:
+        root: Directory holding the runs
+        ttl: Seconds a run whose date range reached past its mining day stays
+            reusable; later prices could still change such a run's rules
+    """
+
+    def __init__(self, root, ttl=3600):
+        self.root = root
+        self.ttl = ttl
+
+    def _run_dir(self, tickers, start_date, end_date):
+        return os.path.join(self.root, run_key(tickers, start_date, end_date))
+
+    def save(self, tickers, start_date, end_date, min_support, min_lift, rules, n_transactions):
+        """
+        Store the rules of one mining run.
+
+        Args:
+            tickers: Tickers mined
+            start_date: Inclusive start, YYYY-MM-DD
+            end_date: Exclusive end, YYYY-MM-DD
+            min_support: Support threshold the rules were mined with
+            min_lift: Lift threshold the rules were mined with
+            rules: DataFrame from `association.mine_rules`
+            n_transactions: Number of days mined
+
+        Returns:
+            The StoredRules as written
+        """
+        items = sorted({name for side in ("antecedents", "consequents") for s in rules[side] for name in s})
+        index = {name: i for i, name in enumerate(items)}
+        columns = {"items": np.array(items, dtype=str)}
+        for side in ("antecedent", "consequent"):
+            columns[f"{side}_offsets"], columns[f"{side}_items"] = _encode_itemsets(list(rules[f"{side}s"]), index)
+        for metric in METRICS:
+            columns[metric] = rules[metric].to_numpy(dtype=np.float64)
+
+        meta = {
+            "tickers": sorted({t.upper() for t in tickers}),
+            "start_date": start_date,
+            "end_date": end_date,
+            "min_support": float(min_support),
+            "min_lift": float(min_lift),
+            "transactions": int(n_transactions),
+            "rules": len(rules),
+            "created_at": time.time(),
+        }
+
+        run_dir = self._run_dir(tickers, start_date, end_date)
+        os.makedirs(run_dir, exist_ok=True)
+        name = f"s{min_support:g}_l{min_lift:g}"
+        data_path = os.path.join(run_dir, f"{name}.npz")
+        meta_path = os.path.join(run_dir, f"{name}.json")
+
+        # Write to temporary files and rename, data before sidecar, so readers never see a partial run
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(f"{data_path}.{suffix}", "wb") as f:
+            np.savez(f, **{_column_file_name(k): v for k, v in columns.items()})
+        os.replace(f"{data_path}.{suffix}", data_path)
+        with open(f"{meta_path}.{suffix}", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.{suffix}", meta_path)
+
+        return StoredRules(meta, columns)
+
+    def _reusable(self, meta):
+        # A range that ended before the run was mined will not change
+        mined_on = pd.Timestamp(meta["created_at"], unit="s").normalize()
+        return pd.Timestamp(meta["end_date"]) <= mined_on or time.time() - meta["created_at"] < self.ttl
+
+    def find(self, tickers, start_date, end_date, min_support, min_lift):
+        """
+        The stored run that can answer (min_support, min_lift) by filtering, or None.
+
+        Among runs mined with thresholds no stricter than requested, the one
+        with the highest thresholds (fewest rules to filter) is returned.
+        """
+        candidates = []
+        for meta_path in glob.glob(os.path.join(self._run_dir(tickers, start_date, end_date), "*.json")):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if meta["min_support"] <= min_support and meta["min_lift"] <= min_lift and self._reusable(meta):
+                candidates.append((meta["min_support"], meta["min_lift"], meta_path, meta))
+        if not candidates:
+            return None
+
+        *_, meta_path, meta = max(candidates, key=lambda c: c[:2])
+        try:
+            with np.load(meta_path[:-len(".json")] + ".npz") as data:
+                columns = {key: data[key] for key in data.files}
+        except (OSError, ValueError):
+            return None
+        for metric in METRICS:
+            columns[metric] = columns.pop(_column_file_name(metric))
+        return StoredRules(meta, columns)
@@ -0,0 +1,203 @@
+"""
+Quota-aware scheduler for upstream API calls.
+
+Identical in-flight calls (same key) are coalesced into one upstream request
+whose result every caller shares. Calls are metered by a token bucket sized
+to the API plan's credits per minute; when the bucket is empty they queue and
+are dispatched earliest-deadline-first instead of being rejected. A call that
+upstream still answers with a rate-limit error is put back in the queue, a few
+times at most: a used-up daily quota is reported the same way and would
+otherwise keep callers waiting until it resets.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+
+class UpstreamRateLimited(Exception):
+    """Raised by a scheduled call when upstream reports the credit limit was hit."""
+
+
+class _Job:
+    def __init__(self, key, call, cost, deadline):
+        self.key = key
+        self.call = call
+        self.cost = cost
+        self.deadline = deadline
+        self.future = asyncio.get_running_loop().create_future()
+        self.dispatched = False
+        self.attempts = 0
+
+
+class TokenBucket:
+    """Continuously refilling token bucket; `capacity` tokens refill over `period` seconds."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        """Seconds until `cost` tokens are available (costs above capacity need a full bucket)."""
+        self._refill()
+        needed = min(cost, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def take(self, cost):
+        # May go negative for calls costing more than the capacity; later calls then wait it off
+        self._refill()
+        self.tokens -= cost
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class UpstreamScheduler:
+    """
+    Coalesce, meter and prioritise upstream calls.
+
+    Args:
+        credits_per_minute: Upstream credits available per minute
+        default_timeout: Deadline, in seconds from submission, for calls without one
+        max_attempts: Upstream calls per job before a rate-limit error is passed to its callers
+        grace: Seconds past its deadline after which a rate-limited job is not retried
+    """
+
+    def __init__(self, credits_per_minute, default_timeout=30.0, max_attempts=3, grace=30.0):
+        self.bucket = TokenBucket(credits_per_minute)
+        self.default_timeout = default_timeout
+        self.max_attempts = max_attempts
+        self.grace = grace
+        self._queue = []
+        self._sequence = itertools.count()
+        self._inflight = {}
+        self._wakeup = None
+        self._dispatcher = None
+        self._loop = None
+        self._running = set()
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done() or self._loop is not loop:
+            # Queued work belongs to the loop it was submitted on; start afresh on a new loop
+            self._queue, self._inflight = [], {}
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _enqueue(self, job, deadline):
+        heapq.heappush(self._queue, (deadline, next(self._sequence), job))
+        self._wakeup.set()
+
+    async def submit(self, key, call, cost=1, deadline=None):
+        """
+        Run `call()` (a coroutine function) through the scheduler and return its result.
+
+        Args:
+            key: Hashable identity of the call; concurrent submissions with the same key share one call
+            call: Zero-argument coroutine function performing the upstream request
+            cost: Credits the call consumes
+            deadline: `time.monotonic()` value by which the caller wants the result;
+                used for ordering, late calls still run
+
+        Raises:
+            UpstreamRateLimited: Upstream kept refusing the call for lack of credits
+        """
+        self._ensure_dispatcher()
+        deadline = deadline if deadline is not None else time.monotonic() + self.default_timeout
+
+        job = self._inflight.get(key)
+        if job is None:
+            job = _Job(key, call, cost, deadline)
+            self._inflight[key] = job
+            self._enqueue(job, deadline)
+        elif not job.dispatched and deadline < job.deadline:
+            # A more urgent caller joined a queued call; queue it again at the earlier deadline
+            job.deadline = deadline
+            self._enqueue(job, deadline)
+
+        # Shield so one cancelled caller does not cancel the call shared with others
+        return await asyncio.shield(job.future)
+
+    async def _dispatch(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            deadline, _, job = self._queue[0]
+            if job.dispatched or deadline != job.deadline:
+                # Stale entry left behind by a deadline upgrade
+                heapq.heappop(self._queue)
+                continue
+
+            delay = self.bucket.wait_time(job.cost)
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    # Wake early if a more urgent call arrives while waiting for credits
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            job.dispatched = True
+            self.bucket.take(job.cost)
+            task = asyncio.get_running_loop().create_task(self._run(job))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, job):
+        job.attempts += 1
+        try:
+            result = await job.call()
+        except UpstreamRateLimited as e:
+            # Upstream's view of the quota disagrees with ours; wait for a refill and retry
+            self.bucket.drain()
+            if job.attempts < self.max_attempts and time.monotonic() < job.deadline + self.grace:
+                logging.warning(f"Upstream rate limit hit for {job.key}; requeueing")
+                job.dispatched = False
+                self._enqueue(job, job.deadline)
+                return
+            logging.warning(f"Upstream rate limit hit for {job.key} after {job.attempts} attempts; giving up")
+            self._inflight.pop(job.key, None)
+            job.future.set_exception(e)
+            return
+        except Exception as e:
+            self._inflight.pop(job.key, None)
+            job.future.set_exception(e)
+            return
+
+        self._inflight.pop(job.key, None)
+        job.future.set_result(result)
+
+    def pending(self):
+        """Number of queued calls not yet dispatched."""
+        # A call whose deadline was moved earlier also has a stale entry at its old deadline
+        return sum(1 for deadline, _, job in self._queue if not job.dispatched and deadline == job.deadline)
+
+    def spare_credits(self):
+        """Credits available right now that no queued call is waiting for."""
+        if self.pending():
+            return 0.0
+        return max(0.0, self.bucket.available())
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
@@ -0,0 +1,158 @@
+"""
+On-disk OHLCV store, one memory-mapped NumPy file per (symbol, interval).
+
+Bars are kept as a structured array sorted by timestamp so reads are a single
+`np.load(..., mmap_mode="r")` and refreshes only need the bars newer than the
+last stored one. A small JSON sidecar records when the series was last
+refreshed and whether it holds the full upstream history.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from market_hours import settled_since
+
+BAR_DTYPE = np.dtype([
+    ("datetime", "datetime64[ns]"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "f8"),
+])
+
+PRICE_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+def parse_values(values):
+    """
+    Convert Twelve Data `values` (newest first, string fields) into bars.
+
+    Returns:
+        Structured array with BAR_DTYPE in chronological order
+    """
+    values = values[::-1]
+    bars = np.empty(len(values), dtype=BAR_DTYPE)
+    bars["datetime"] = np.array([v["datetime"] for v in values], dtype="datetime64[ns]")
+    for field in PRICE_FIELDS:
+        # Forex and crypto series come without a volume column
+        bars[field] = np.array([v.get(field, "nan") for v in values], dtype="f8")
+    return bars
+
+
+def to_frame(bars):
+    """Build the Date-indexed OHLCV DataFrame the API has always returned."""
+    df = pd.DataFrame({
+        "Open": bars["open"],
+        "High": bars["high"],
+        "Low": bars["low"],
+        "Close": bars["close"],
+        "Volume": bars["volume"],
+    }, index=pd.DatetimeIndex(bars["datetime"], name="Date"))
+
+    # Volumes are whole numbers upstream; keep them integral unless some are missing
+    if not df["Volume"].isna().any():
+        df["Volume"] = df["Volume"].astype("int64")
+    return df
+
+
+def format_timestamp(timestamp):
+    """Format a bar timestamp the way Twelve Data expects `start_date`."""
+    return str(np.datetime_as_string(timestamp, unit="s")).replace("T", " ")
+
+
+class BarStore:
+    """Per-(symbol, interval) bar files under `root`."""
+
+    def __init__(self, root, max_bars=5000):
+        self.root = root
+        self.max_bars = max_bars
+
+    def _paths(self, symbol, interval):
+        # Symbols such as BRK/A or EUR/USD contain slashes
+        name = f"{symbol.upper().replace('/', '_')}__{interval}"
+        base = os.path.join(self.root, name)
+        return f"{base}.npy", f"{base}.json"
+
+    def load(self, symbol, interval):
+        """Return the stored bars memory-mapped read-only, or None if absent."""
+        data_path, _ = self._paths(symbol, interval)
+        try:
+            return np.load(data_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def meta(self, symbol, interval):
+        """Return the sidecar metadata, or an empty dict if absent."""
+        _, meta_path = self._paths(symbol, interval)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def is_fresh(self, symbol, interval, ttl):
+        """
+        True if the series needs no refresh: it was refreshed from upstream less
+        than `ttl` seconds ago, or after the last close while the market is shut.
+
+        Symbols with a slash (EUR/USD, BTC/USD) trade around the clock and only
+        follow the TTL.
+        """
+        refreshed_at = self.meta(symbol, interval).get("refreshed_at", 0)
+        if time.time() - refreshed_at < ttl:
+            return True
+        return "/" not in symbol and settled_since(refreshed_at)
+
+    def update(self, symbol, interval, new_bars, backfilled=False):
+        """
+        Merge freshly fetched bars into the stored series.
+
+        Bars at or after the first new timestamp are replaced, since the last
+        stored bar may have been an incomplete, still-forming one. New bars that
+        do not overlap the stored range replace the series outright.
+
+        Args:
+            symbol: Ticker symbol
+            interval: Twelve Data interval, e.g. "1h" or "1day"
+            new_bars: Structured array with BAR_DTYPE in chronological order
+            backfilled: Whether `new_bars` is the full upstream history
+
+        Returns:
+            The merged bars as stored
+        """
+        stored = self.load(symbol, interval)
+        meta = self.meta(symbol, interval)
+
+        if stored is not None and len(stored) and len(new_bars) and new_bars["datetime"][0] <= stored["datetime"][-1]:
+            keep = np.searchsorted(stored["datetime"], new_bars["datetime"][0], side="left")
+            merged = np.concatenate([stored[:keep], new_bars])
+            backfilled = backfilled or meta.get("backfilled", False)
+        elif stored is not None and not len(new_bars):
+            merged = np.asarray(stored)
+            backfilled = backfilled or meta.get("backfilled", False)
+        else:
+            merged = np.asarray(new_bars, dtype=BAR_DTYPE)
+
+        merged = merged[-self.max_bars:]
+        self._write(symbol, interval, merged, {"refreshed_at": time.time(), "backfilled": backfilled})
+        return merged
+
+    def _write(self, symbol, interval, bars, meta):
+        os.makedirs(self.root, exist_ok=True)
+        data_path, meta_path = self._paths(symbol, interval)
+
+        # Write to temporary files and rename so readers never see a partial file
+        tmp_data_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_data_path, "wb") as f:
+            np.save(f, bars)
+        os.replace(tmp_data_path, data_path)
+
+        tmp_meta_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_meta_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta_path, meta_path)
@@ -0,0 +1,227 @@
+"""
+Push channel for live bars and rolling forecasts.
+
+Clients subscribe to symbols and receive deltas instead of polling for full
+series. Each subscribed symbol has one feed: a task that polls the symbol's
+bars (through the bar store, so upstream sees at most one refresh per TTL),
+works out which bars are new or changed since the last poll, reruns the
+forecast when they are, and publishes only the changed rows and forecast
+steps. A message is encoded once and the same string is queued for every
+subscriber, so the work per poll depends on the number of symbols, not on
+the number of connected clients.
+
+Messages are JSON objects with a "type":
+    snapshot  the last bars and the current forecast (null until the first
+              one is computed), sent on subscribing
+    bars      new bars, or the forming bar with updated values
+    forecast  forecast steps whose value changed; all of them when a new bar
+              moved the forecast's base
+    error     a poll or forecast failed (the feed keeps polling and bars keep
+              flowing), or a subscription was rejected (no symbol)
+"""
+import asyncio
+import json
+import logging
+
+import numpy as np
+
+BAR_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+def encode_bars(bars):
+    """Structured bars -> JSON-ready rows."""
+    timestamps = np.datetime_as_string(bars["datetime"], unit="s")
+    columns = [np.asarray(bars[field], dtype=float).tolist() for field in BAR_FIELDS]
+    return [
+        {"datetime": str(timestamp), **dict(zip(BAR_FIELDS, values))}
+        for timestamp, *values in zip(timestamps, *columns)
+    ]
+
+
+def _message(kind, symbol, **fields):
+    return kind, json.dumps({"type": kind, "symbol": symbol, **fields})
+
+
+class Subscriber:
+    """One connection's queue of (type, JSON) messages and the symbols it follows."""
+
+    def __init__(self, max_queue=256):
+        self.queue = asyncio.Queue(max_queue)
+        self.symbols = set()
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class _Feed:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.subscribers = set()
+        self.bars = None
+        self.forecast = None
+        self.forecast_base = None
+        self.task = None
+        self._snapshot = None
+
+    def snapshot(self):
+        """The feed's current state as a snapshot message, encoded once per change."""
+        if self._snapshot is None:
+            forecast = None
+            if self.forecast is not None:
+                forecast = {"base": str(np.datetime_as_string(self.forecast_base, unit="s")), "values": self.forecast.tolist()}
+            self._snapshot = _message("snapshot", self.symbol, bars=encode_bars(self.bars), forecast=forecast)
+        return self._snapshot
+
+
+class StreamHub:
+    """
+    Per-symbol feeds shared by every subscriber.
+
+    A feed starts with its first subscriber and stops with its last one.
+    Only used from the event loop, so unlocked.
+
+    Args:
+        poll: Coroutine function symbol -> structured bars (see store.BAR_DTYPE)
+        forecast: Coroutine function (symbol, bars) -> forecast values, or None for no forecasts
+        interval: Seconds between polls of one symbol
+        snapshot_bars: Bars sent in a snapshot
+        max_queue: Messages buffered per subscriber; a subscriber that falls
+            further behind is sent fresh snapshots instead of the deltas it missed
+    """
+
+    def __init__(self, poll, forecast=None, interval=60.0, snapshot_bars=120, max_queue=256):
+        self.poll = poll
+        self.forecast = forecast
+        self.interval = interval
+        self.snapshot_bars = snapshot_bars
+        self.max_queue = max_queue
+        self.feeds = {}
+
+    def subscriber(self):
+        return Subscriber(self.max_queue)
+
+    def subscribe(self, subscriber, symbol):
+        symbol = symbol.upper()
+        if symbol in subscriber.symbols:
+            return
+        feed = self.feeds.get(symbol)
+        if feed is None:
+            feed = self.feeds[symbol] = _Feed(symbol)
+            feed.task = asyncio.get_running_loop().create_task(self._run(feed))
+        feed.subscribers.add(subscriber)
+        subscriber.symbols.add(symbol)
+        # Before the first poll completes, that poll's snapshot reaches every subscriber
+        if feed.bars is not None:
+            self._deliver(subscriber, feed.snapshot())
+
+    def unsubscribe(self, subscriber, symbol):
+        symbol = symbol.upper()
+        subscriber.symbols.discard(symbol)
+        feed = self.feeds.get(symbol)
+        if feed is None:
+            return
+        feed.subscribers.discard(subscriber)
+        if not feed.subscribers:
+            feed.task.cancel()
+            del self.feeds[symbol]
+
+    def drop(self, subscriber):
+        for symbol in list(subscriber.symbols):
+            self.unsubscribe(subscriber, symbol)
+
+    def notice(self, subscriber, detail):
+        """Queue an error about the subscriber's own request, e.g. a malformed subscription."""
+        self._deliver(subscriber, _message("error", None, detail=detail))
+
+    def status(self):
+        """Subscribers per symbol."""
+        return {symbol: len(feed.subscribers) for symbol, feed in sorted(self.feeds.items())}
+
+    async def close(self):
+        tasks = [feed.task for feed in self.feeds.values()]
+        self.feeds.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, feed):
+        while True:
+            try:
+                await self._update(feed, await self.poll(feed.symbol))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Stream poll for {feed.symbol} failed: {e}")
+                self._publish(feed, _message("error", feed.symbol, detail=str(e)))
+            await asyncio.sleep(self.interval)
+
+    async def _update(self, feed, bars):
+        tail = np.array(bars[-self.snapshot_bars:])
+        if feed.bars is None:
+            # Bars go out first; the forecast follows as a delta, so a failing forecast never holds them back
+            feed.bars = tail
+            self._publish(feed, feed.snapshot())
+            await self._update_forecast(feed, bars)
+            return
+
+        # Bars from the last one sent on: new ones, and the forming bar if its values moved
+        start = int(np.searchsorted(tail["datetime"], feed.bars["datetime"][-1], side="left"))
+        changed = tail[start:]
+        if len(changed) and changed["datetime"][0] == feed.bars["datetime"][-1] and changed[0] == feed.bars[-1]:
+            changed = changed[1:]
+        if len(changed):
+            feed.bars = tail
+            feed._snapshot = None
+            self._publish(feed, _message("bars", feed.symbol, bars=encode_bars(changed)))
+        elif feed.forecast is not None:
+            return
+        # New bars move the forecast; without them, only a forecast that has not succeeded yet is retried
+        await self._update_forecast(feed, bars)
+
+    async def _update_forecast(self, feed, bars):
+        if self.forecast is None:
+            return
+        try:
+            values = await self.forecast(feed.symbol, bars)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Stream forecast for {feed.symbol} failed: {e}")
+            self._publish(feed, _message("error", feed.symbol, detail=f"Forecast failed: {e}"))
+            return
+        if values is None:
+            return
+        values = np.round(np.asarray(values, dtype=float), 4)
+        base = bars["datetime"][-1]
+        if feed.forecast is None or base != feed.forecast_base or len(values) != len(feed.forecast):
+            steps = np.arange(len(values))
+        else:
+            steps = np.flatnonzero(values != feed.forecast)
+        feed.forecast, feed.forecast_base, feed._snapshot = values, base, None
+        if len(steps):
+            self._publish(feed, _message(
+                "forecast",
+                feed.symbol,
+                base=str(np.datetime_as_string(base, unit="s")),
+                # 1-based horizon step -> value
+                changed=[[int(step) + 1, float(values[step])] for step in steps],
+            ))
+
+    def _publish(self, feed, message):
+        for subscriber in list(feed.subscribers):
+            self._deliver(subscriber, message)
+
+    def _deliver(self, subscriber, message):
+        try:
+            subscriber.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Missed deltas cannot be replayed; resend the state of everything it follows instead
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            for symbol in subscriber.symbols:
+                feed = self.feeds.get(symbol)
+                if feed is not None and feed.bars is not None:
+                    try:
+                        subscriber.queue.put_nowait(feed.snapshot())
+                    except asyncio.QueueFull:
+                        break
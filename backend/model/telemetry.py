@@ -0,0 +1,342 @@
+"""
+Request telemetry: per-stage timers, Prometheus histograms, Server-Timing
+headers, an opt-in sampling profiler and non-blocking logging.
+
+Code marks where a request spends its time with `stage("upstream")` blocks
+(or `record_stage` for long spans). `TelemetryMiddleware` collects the
+stages of each request, adds them to the response as a `Server-Timing`
+header, and folds them into histograms served in the Prometheus text format
+by `render_metrics()`. `TimedRoute` adds the stages FastAPI itself spends:
+"request" (body parsing and validation) and "serialize" (encoding the
+endpoint's return value).
+
+With REQUEST_PROFILING=1, a request sent with an `X-Profile: 1` header (or
+`?profile=1`) is also sampled by a stack profiler; the folded stacks are
+written under PROFILE_DIR for flamegraph.pl or speedscope.
+"""
+import atexit
+import bisect
+import functools
+import inspect
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from fastapi.routing import APIRoute
+
+# Seconds; covers cached responses (~1 ms) up to rate-limited upstream waits
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROFILING_ENABLED = os.getenv("REQUEST_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+# Fraction of high-volume debug payloads (raw upstream responses and the like) that are logged
+DEBUG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0.01"))
+
+
+class Histogram:
+    """A Prometheus-style histogram with one series per combination of label values."""
+
+    def __init__(self, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts, the last one for +Inf; made cumulative when rendered
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        """Exposition lines for every series, in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        for label_values, counts, total in sorted(snapshot):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "stock_api_request_duration_seconds",
+    "Time from receiving a request to sending its last byte.",
+    ("route", "method", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "stock_api_stage_duration_seconds",
+    "Time spent per request in each stage (upstream, parse, inference, serialize, ...).",
+    ("route", "stage"),
+)
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(REQUEST_SECONDS.render() + STAGE_SECONDS.render()) + "\n"
+
+
+class RequestTimings:
+    """Seconds per stage for one request; repeated stages add up."""
+
+    def __init__(self):
+        self.stages = {}
+        self.endpoint_started = None
+        self.endpoint_finished = None
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Shared by the tasks and threadpool calls of one request, which copy the context
+_current = ContextVar("request_timings", default=None)
+# HTTP requests still waiting for their response to start; background work yields while any are
+_in_flight = 0
+
+
+def in_flight():
+    """Number of HTTP requests currently being handled, not counting responses already streaming."""
+    return _in_flight
+
+
+def record_stage(name, seconds):
+    """Add `seconds` to stage `name` of the current request; a no-op outside requests."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage `name` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that also records request parsing and response serialisation as stages."""
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if inspect.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(**values):
+                timings = _current.get()
+                if timings is not None:
+                    timings.endpoint_started = time.perf_counter()
+                try:
+                    return await call(**values)
+                finally:
+                    if timings is not None:
+                        timings.endpoint_finished = time.perf_counter()
+
+            self.dependant.call = timed_call
+
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_finished is not None:
+                timings.add("request", timings.endpoint_started - started)
+                timings.add("serialize", time.perf_counter() - timings.endpoint_finished)
+            return response
+
+        return timed_handler
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread at a fixed interval.
+
+    Samples cover the event loop and the threadpool alike, so work done for
+    other requests in flight at the same time shows up too.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        """Write the samples as folded stacks, one "frame;frame;... count" line each."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# One profiled request at a time keeps the profiler's own overhead bounded
+_profile_lock = threading.Lock()
+
+
+def _wants_profile(scope):
+    if not PROFILING_ENABLED:
+        return False
+    headers = dict(scope.get("headers") or [])
+    return headers.get(b"x-profile") == b"1" or b"profile=1" in scope.get("query_string", b"").split(b"&")
+
+
+class TelemetryMiddleware:
+    """ASGI middleware that times each request, reports its stages and optionally profiles it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        global _in_flight
+        _in_flight += 1
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        profiler = profile_path = None
+        if _wants_profile(scope) and _profile_lock.acquire(blocking=False):
+            name = scope["path"].strip("/").replace("/", "_") or "root"
+            profile_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}.folded")
+            profiler = SamplingProfiler().start()
+
+        waiting = True
+
+        async def send_with_timing(message):
+            nonlocal status, waiting
+            if message["type"] == "http.response.start":
+                global _in_flight
+                # A long-lived stream (see app.py /stream) stops counting once it starts
+                _in_flight -= 1
+                waiting = False
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing(time.perf_counter() - started).encode()))
+                if profile_path is not None:
+                    headers.append((b"x-profile-path", profile_path.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if waiting:
+                _in_flight -= 1
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                _profile_lock.release()
+                profiler.write(profile_path)
+
+            # Route templates rather than raw paths keep the label set bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, path, scope["method"], str(status))
+            for name, seconds in timings.stages.items():
+                STAGE_SECONDS.observe(seconds, path, name)
+
+
+def configure_logging(log_file, level=logging.INFO):
+    """
+    Log to the console and `log_file` from a background thread.
+
+    Callers only put records on a queue; a QueueListener does the formatting
+    and the blocking writes. Like `logging.basicConfig`, this does nothing if
+    the root logger already has handlers.
+
+    Returns:
+        The running QueueListener, or None if logging was already configured
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.StreamHandler(),  # Output to console
+        logging.FileHandler(log_file),  # Output to a log file
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(listener.stop)
+
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
+    return listener
+
+
+def debug_sampled(build, rate=None):
+    """
+    Log `build()` at DEBUG for a sampled fraction of calls.
+
+    `build` only runs for records that are logged, so large payloads are not
+    formatted at all while DEBUG is off.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    if random.random() < (DEBUG_SAMPLE_RATE if rate is None else rate):
+        logging.debug(build())
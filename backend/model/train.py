@@ -0,0 +1,310 @@
+"""
+Train the LSTM price forecaster for one or many tickers.
+
+Windows over each ticker's scaled closes are strided views (no per-window
+copies); tf.data gathers each shuffled batch from that view and prefetches
+the next one while the current batch trains. Tickers train in parallel
+worker processes.
+
+Usage:
+    python train.py MSFT_2006-01-01_to_2018-01-01.csv AAPL_2006-01-01_to_2018-01-01.csv \\
+        --model-path "{ticker}_stock_price_prediction.pkl" --scaler-path "{ticker}_scaler.pkl" --workers 2
+    python train.py MSFT AAPL --dataset history  # tickers from an ingest.py dataset
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Define the sequence length (must match the sequence length used by the API)
+sequence_length = 60
+
+CLOSE_COLUMNS = ['Close', 'close', 'Adj Close', 'adj close', 'Closing Price', 'closing price']
+
+
+def ticker_from_path(csv_path):
+    """Ticker for a Kaggle-style file such as MSFT_2006-01-01_to_2018-01-01.csv."""
+    return os.path.basename(csv_path).split("_")[0].upper()
+
+
+def load_closes(csv_path, dataset=None):
+    """
+    Load a ticker CSV and return its closing prices in date order.
+
+    With `dataset` (an ingest.py output directory), `csv_path` is a ticker
+    whose closes are memory-mapped from the dataset instead.
+
+    Returns:
+        Tuple of (dates, closes) where closes is a float array shaped (n, 1)
+    """
+    if dataset is not None:
+        from ingest import load_symbol
+        bars = load_symbol(dataset, ticker_from_path(csv_path), columns=["datetime", "close"])
+        return bars["datetime"], bars["close"].astype(np.float64).reshape(-1, 1)
+
+    df = pd.read_csv(csv_path)
+
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+        df.sort_values('Date', inplace=True)
+        df.set_index('Date', inplace=True)
+    else:
+        # Otherwise, assume the index holds date information; convert index to datetime.
+        df.index = pd.to_datetime(df.index)
+        df.sort_index(inplace=True)
+
+    target_col = next((col for col in CLOSE_COLUMNS if col in df.columns), None)
+    if target_col is None:
+        raise KeyError(f"None of the expected closing price columns {CLOSE_COLUMNS} were found in {csv_path}. Available columns: {df.columns.tolist()}")
+
+    return df.index.values, df[[target_col]].values.astype(np.float64)
+
+
+def training_meta_path(model_path):
+    """Sidecar recording what `model_path` was trained on, e.g. stock_price_prediction.training.json."""
+    return os.path.splitext(model_path)[0] + ".training.json"
+
+
+def read_training_meta(model_path):
+    """The model's training sidecar, or an empty dict if it has none."""
+    try:
+        with open(training_meta_path(model_path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_training_meta(model_path, meta):
+    path = training_meta_path(model_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def make_windows(scaled, seq_length=sequence_length):
+    """
+    Build (X, y) training pairs: the past `seq_length` values predict the next one.
+
+    X is a read-only strided view over `scaled`, shaped (n - seq_length, seq_length),
+    so no window is copied until a batch is gathered from it.
+    """
+    series = np.ascontiguousarray(scaled[:, 0], dtype=np.float32)
+    X = np.lib.stride_tricks.sliding_window_view(series, seq_length)[:-1]
+    y = series[seq_length:]
+    return X, y
+
+
+def make_dataset(X, y, indices, batch_size=32, shuffle=False, seed=None):
+    """
+    tf.data pipeline over the rows of the strided view `X` selected by `indices`.
+
+    Only the indices are shuffled; each batch's windows are gathered from the
+    view on demand and the next batch is prefetched.
+    """
+    import tensorflow as tf
+
+    def gather(batch_indices):
+        return X[batch_indices][..., np.newaxis], y[batch_indices]
+
+    def load_batch(batch_indices):
+        windows, targets = tf.numpy_function(gather, [batch_indices], [tf.float32, tf.float32])
+        windows.set_shape([None, X.shape[1], 1])
+        targets.set_shape([None])
+        return windows, targets
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).map(load_batch).prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(seq_length=sequence_length):
+    """The 2x50-unit LSTM the API serves."""
+    from tensorflow.keras.layers import LSTM, Dense, Dropout, Input
+    from tensorflow.keras.models import Sequential
+
+    model = Sequential()
+    model.add(Input(shape=(seq_length, 1)))
+    model.add(LSTM(50, return_sequences=True))
+    model.add(Dropout(0.2))
+    model.add(LSTM(50, return_sequences=False))
+    model.add(Dropout(0.2))
+    model.add(Dense(25))
+    model.add(Dense(1))  # Output layer to predict the closing price
+
+    model.compile(optimizer='adam', loss='mean_squared_error')
+    return model
+
+
+def evaluate(model, X, y, indices, scaler, batch_size=1024):
+    """MAE and RMSE in price units over the windows selected by `indices`."""
+    predictions = model.predict(X[indices][..., np.newaxis], batch_size=batch_size, verbose=0)
+    predictions = scaler.inverse_transform(predictions)
+    actual = scaler.inverse_transform(y[indices].reshape(-1, 1))
+    errors = predictions - actual
+    return float(np.mean(np.abs(errors))), float(np.sqrt(np.mean(errors ** 2)))
+
+
+def train_ticker(csv_path, model_path, scaler_path, epochs=50, batch_size=32, train_split=0.8, threads=None, seed=None, dataset=None):
+    """
+    Train one ticker's model and save it with its scaler.
+
+    Runs inside a worker process; `threads` caps TensorFlow's thread pools so
+    parallel workers do not oversubscribe the CPU.
+
+    Returns:
+        Dict of metrics for the held-out split
+    """
+    import tensorflow as tf
+    from inference import extract_layers, fingerprint, save_layers
+    from sklearn.preprocessing import MinMaxScaler
+
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    if seed is not None:
+        tf.keras.utils.set_random_seed(seed)
+
+    started = time.perf_counter()
+    ticker = ticker_from_path(csv_path)
+    dates, closes = load_closes(csv_path, dataset)
+
+    # Scale the data to the range [0, 1]
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    scaled_data = scaler.fit_transform(closes)
+
+    X, y = make_windows(scaled_data)
+
+    # Chronological split (80% training, 20% testing by default)
+    train_size = int(len(X) * train_split)
+    train_indices = np.arange(train_size)
+    test_indices = np.arange(train_size, len(X))
+
+    model = build_model()
+    model.fit(
+        make_dataset(X, y, train_indices, batch_size, shuffle=True, seed=seed),
+        validation_data=make_dataset(X, y, test_indices, batch_size),
+        epochs=epochs,
+        shuffle=False,  # The dataset already reshuffles its indices every epoch
+        verbose=0,
+    )
+
+    mae, rmse = evaluate(model, X, y, test_indices, scaler)
+
+    # The API reloads these files when they change, so each is renamed into place, and the
+    # scaler goes first: a reload in between pairs the old model with the new scaler, never
+    # new weights with the old scaler.
+    tmp_path = f"{scaler_path}.{os.getpid()}.tmp"
+    joblib.dump(scaler, tmp_path)
+    os.replace(tmp_path, scaler_path)
+    tmp_path = f"{model_path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path)
+    source_fingerprint = fingerprint(tmp_path)
+    os.replace(tmp_path, model_path)
+    # Export weights for the NumPy inference backend so the API can serve without TensorFlow
+    save_layers(extract_layers(model), os.path.splitext(model_path)[0] + ".npz", source_fingerprint)
+    # The last bar trained on; finetune.py continues from here
+    write_training_meta(model_path, {
+        "ticker": ticker,
+        "cutoff": str(np.datetime64(dates[-1], "D")),
+        "trained_at": time.time(),
+        "samples": int(len(X)),
+        "epochs": epochs,
+    })
+
+    return {
+        "ticker": ticker,
+        "model_path": model_path,
+        "scaler_path": scaler_path,
+        "samples": int(len(X)),
+        "mae": mae,
+        "rmse": rmse,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def train_many(csv_paths, model_path, scaler_path, workers=1, **kwargs):
+    """
+    Train every CSV in `csv_paths`, `workers` tickers at a time.
+
+    `model_path` and `scaler_path` may contain "{ticker}" placeholders.
+    """
+    if len(csv_paths) > 1 and ("{ticker}" not in model_path or "{ticker}" not in scaler_path):
+        raise ValueError("Training several tickers needs '{ticker}' in --model-path and --scaler-path")
+
+    workers = max(1, min(workers, len(csv_paths)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+
+    # spawn rather than fork: TensorFlow does not survive being forked
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = {}
+        for csv_path in csv_paths:
+            ticker = ticker_from_path(csv_path)
+            future = pool.submit(
+                train_ticker,
+                csv_path,
+                model_path.format(ticker=ticker),
+                scaler_path.format(ticker=ticker),
+                threads=threads,
+                **kwargs,
+            )
+            futures[future] = csv_path
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Training failed for {futures[future]}: {e}")
+                results.append({"ticker": ticker_from_path(futures[future]), "error": str(e)})
+                continue
+            logging.info(f"{result['ticker']}: MAE {result['mae']:.4f}, RMSE {result['rmse']:.4f} in {result['seconds']}s")
+            results.append(result)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train LSTM price forecasters from ticker CSVs")
+    parser.add_argument("csv_paths", nargs="+", help="Kaggle-style ticker CSVs with Date and Close columns, or tickers with --dataset")
+    parser.add_argument("--dataset", default=None, help="Read closes from this ingest.py dataset")
+    parser.add_argument("--model-path", default="{ticker}_stock_price_prediction.pkl")
+    parser.add_argument("--scaler-path", default="{ticker}_scaler.pkl")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--train-split", type=float, default=0.8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Tickers trained in parallel")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    results = train_many(
+        args.csv_paths,
+        args.model_path,
+        args.scaler_path,
+        workers=args.workers,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        train_split=args.train_split,
+        seed=args.seed,
+        dataset=args.dataset,
+    )
+
+    for result in sorted(results, key=lambda r: r["ticker"]):
+        if "error" in result:
+            print(f"{result['ticker']}: failed ({result['error']})")
+        else:
+            print(f"🚀 {result['ticker']} lstm MAE: {result['mae']:.4f}, RMSE: {result['rmse']:.4f} -> {result['model_path']}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
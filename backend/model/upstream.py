@@ -0,0 +1,68 @@
+"""
+Shared async I/O for upstream data providers.
+
+All Twelve Data calls go through one keep-alive `httpx.AsyncClient` with a
+bounded connection pool, so requests reuse TLS connections instead of opening
+a new one per call. Blocking library calls (yfinance) run on a bounded thread
+pool so independent sub-fetches can be awaited concurrently.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+_client = None
+_executor = None
+
+
+def get_client():
+    """Return the process-wide HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20")),
+        )
+        timeout = httpx.Timeout(float(os.getenv("UPSTREAM_TIMEOUT", "30")))
+        _client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    return _client
+
+
+async def http_get_json(url, params):
+    """
+    GET `url` on the shared client and return the decoded JSON body.
+
+    Raises:
+        httpx.HTTPError: On connection errors and non-2xx responses
+    """
+    response = await get_client().get(url, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("UPSTREAM_MAX_THREADS", "32")),
+            thread_name_prefix="upstream",
+        )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking upstream call (e.g. yfinance) on the upstream thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), lambda: func(*args, **kwargs))
+
+
+async def close():
+    """Close the shared client and thread pool; called on application shutdown."""
+    global _client, _executor
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
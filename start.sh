@@ -23,6 +23,22 @@ ls -la
 echo "Python path:"
 python -c "import sys; print(sys.path)"
 
+# One worker by default. Each uvicorn worker keeps its own Twelve Data quota scheduler,
+# request coalescing, bar refresh locks and forecast, correlation and prefetch state, so
+# N workers refetch the same symbols and hit each other's caches only about 1/N of the
+# time. app.py splits TWELVE_DATA_CREDITS_PER_MINUTE evenly between WEB_CONCURRENCY
+# workers to stay within the account's quota; raise it for CPU-bound forecast traffic only.
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+  # Several workers share one model process instead of each loading their own copy
+  export INFERENCE_SERVER=${INFERENCE_SERVER:-127.0.0.1:8765}
+  # The server unpickles what it receives; only processes holding this key may connect
+  export INFERENCE_SERVER_AUTHKEY=${INFERENCE_SERVER_AUTHKEY:-$(python -c 'import secrets; print(secrets.token_hex(32))')}
+  echo "Starting inference server on $INFERENCE_SERVER..."
+  python inference_server.py --model "${MODEL_PATH:-stock_price_prediction.pkl}" --address "$INFERENCE_SERVER" &
+fi
+
 # Start the FastAPI application - IMPORTANT: Binding to 0.0.0.0 is critical for Render
-echo "Starting uvicorn server on port $PORT..."
-exec python -m uvicorn app:app --host 0.0.0.0 --port $PORT --workers 1 
\ No newline at end of file
+echo "Starting uvicorn server on port $PORT with $WEB_CONCURRENCY workers..."
+exec python -m uvicorn app:app --host 0.0.0.0 --port $PORT --workers $WEB_CONCURRENCY